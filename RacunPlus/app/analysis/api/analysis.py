@@ -1,49 +1,124 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.orm import Session
+import asyncio
+import contextlib
+import time
+from typing import Literal
+from uuid import UUID
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from RacunPlus.database import SessionLocal
-from RacunPlus.user.routers import get_current_user
-from RacunPlus.app.analysis.models.analysis import Analysis
+from RacunPlus.settings import settings
+from RacunPlus.dependencies import get_current_user, get_read_db, get_write_db
 from RacunPlus.app.analysis.schemas.analysis import AnalysisGenerateRequest
-from RacunPlus.app.analysis.services.analysis import generate_analysis, analysis_to_response
+from RacunPlus.app.analysis.services.analysis import generate_analysis, generate_local_analysis, analysis_to_response
+from RacunPlus.app.analysis.services.jobs import QueueFullError, submit_analysis, wait_for_job
+from RacunPlus.app.analysis.services.streaming import open_analysis_stream
+from RacunPlus.app.analysis.database.analysis import get_latest_analysis, get_analysis_history, get_analysis_by_id, delete_analysis_by_id
 from RacunPlus.app.analysis.exceptions.analysis import RateLimitExceededError, NoBillsFoundError
 
 router = APIRouter(prefix='/analysis', tags=['analysis'])
 
+DISCONNECT_POLL_SECONDS = 0.5
+# Long-poll re-reads the row at least this often, so jobs finished by another process are seen too.
+JOB_POLL_SECONDS = 1.0
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+
+class ClientDisconnectedError(Exception):
+    pass
 
 
+def rate_limit_error(e: RateLimitExceededError) -> HTTPException:
+    headers = None
+    if e.quota is not None:
+        headers = {**e.quota.headers(), 'Retry-After': str(e.quota.reset_seconds())}
+    return HTTPException(status_code=429, detail=str(e), headers=headers)
+
+
+async def cancel_on_disconnect(request: Request, coro):
+    # Stops the (possibly long) AI call as soon as nobody is waiting for the answer.
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                raise ClientDisconnectedError()
+    finally:
+        if not task.done():
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
 
 
 @router.post('/generate', status_code=201)
-def generate(payload: AnalysisGenerateRequest, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
+async def generate(
+    payload: AnalysisGenerateRequest,
+    request: Request,
+    response: Response,
+    mode: Literal['sync', 'job'] = Query('sync'),
+    engine: Literal['gemini', 'local'] = Query('gemini'),
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_write_db),
+):
     try:
         user_id = current_user['id']
-        analysis = generate_analysis(db, user_id, payload.analysis_type, payload.days)
-        return {'success': True, 'data': analysis_to_response(analysis)}
+        if engine == 'local':
+            # Answers right away, so there is nothing to queue in job mode.
+            analysis = await generate_local_analysis(db, user_id, payload.analysis_type, payload.days)
+            return {'success': True, 'cached': False, 'data': analysis_to_response(analysis)}
+
+        if mode == 'job':
+            analysis, cached, quota = await submit_analysis(db, user_id, payload.analysis_type, payload.days)
+            response.headers.update(quota.headers())
+            if cached:
+                return {'success': True, 'cached': True, 'data': analysis_to_response(analysis)}
+            return JSONResponse(
+                status_code=202,
+                content={'success': True, 'cached': False, 'data': analysis_to_response(analysis)},
+                headers={'Location': f'/analysis/{analysis.id}', **quota.headers()},
+            )
+
+        analysis, cached, quota = await cancel_on_disconnect(request, generate_analysis(db, user_id, payload.analysis_type, payload.days))
+        response.headers.update(quota.headers())
+        return {'success': True, 'cached': cached, 'data': analysis_to_response(analysis)}
+    except ClientDisconnectedError:
+        raise HTTPException(status_code=499, detail='Klijent je prekinuo zahtjev')
+    except QueueFullError:
+        raise HTTPException(status_code=503, detail='Previše analiza je na čekanju, pokušajte kasnije')
     except RateLimitExceededError as e:
-        raise HTTPException(status_code=429, detail=str(e))
+        raise rate_limit_error(e)
     except NoBillsFoundError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post('/generate/stream')
+async def generate_stream(
+    payload: AnalysisGenerateRequest,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_write_db),
+):
+    try:
+        events, quota = await open_analysis_stream(db, current_user['id'], payload.analysis_type, payload.days)
+    except RateLimitExceededError as e:
+        raise rate_limit_error(e)
+    except NoBillsFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    return StreamingResponse(
+        events,
+        media_type='text/event-stream',
+        # Proxies must pass events through as they come instead of buffering the body.
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no', **quota.headers()},
+    )
+
+
 @router.get('/latest')
-def latest(analysis_type: str = None, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    user_id = current_user['id']
-    query = db.query(Analysis).filter(Analysis.user_id == user_id)
-    
-    if analysis_type:
-        query = query.filter(Analysis.analysis_type == analysis_type)
-    
-    analysis = query.order_by(Analysis.created_at.desc()).first()
+async def latest(analysis_type: str = None, current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_read_db)):
+    analysis = await get_latest_analysis(db, current_user['id'], analysis_type)
     
     if not analysis:
         raise HTTPException(status_code=404, detail='Analiza nije pronađena')
@@ -52,14 +127,8 @@ def latest(analysis_type: str = None, current_user: dict = Depends(get_current_u
 
 
 @router.get('/history')
-def history(limit: int = Query(10), offset: int = Query(0), current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    user_id = current_user['id']
-    
-    analyses = db.query(Analysis).filter(
-        Analysis.user_id == user_id
-    ).order_by(Analysis.created_at.desc()).offset(offset).limit(limit).all()
-    
-    total = len(analyses)
+async def history(limit: int = Query(10, ge=1, le=100), offset: int = Query(0, ge=0), current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_read_db)):
+    analyses, total = await get_analysis_history(db, current_user['id'], limit, offset)
     
     return {
         'success': True,
@@ -71,32 +140,34 @@ def history(limit: int = Query(10), offset: int = Query(0), current_user: dict =
 
 
 @router.get('/{analysis_id}')
-def get_analysis(analysis_id: str, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    user_id = current_user['id']
-    
-    analysis = db.query(Analysis).filter(
-        (Analysis.id == analysis_id) & (Analysis.user_id == user_id)
-    ).first()
+async def get_analysis(
+    analysis_id: UUID,
+    wait: float = Query(0, ge=0),
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db),
+):
+    analysis = await get_analysis_by_id(db, current_user['id'], analysis_id)
     
     if not analysis:
         raise HTTPException(status_code=404, detail='Analiza nije pronađena')
+
+    if wait and analysis.status in ('pending', 'running'):
+        # Give the connection back while waiting; re-read from the primary, where the worker writes.
+        await db.close()
+        deadline = time.monotonic() + min(wait, settings.ANALYSIS_MAX_WAIT_SECONDS)
+        while analysis.status in ('pending', 'running') and time.monotonic() < deadline:
+            await wait_for_job(analysis_id, min(JOB_POLL_SECONDS, deadline - time.monotonic()))
+            async with SessionLocal() as fresh:
+                analysis = await get_analysis_by_id(fresh, current_user['id'], analysis_id) or analysis
     
     return {'success': True, 'data': analysis_to_response(analysis)}
 
 
 @router.delete('/{analysis_id}')
-def delete_analysis(analysis_id: str, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    user_id = current_user['id']
-    
-    analysis = db.query(Analysis).filter(
-        (Analysis.id == analysis_id) & (Analysis.user_id == user_id)
-    ).first()
+async def delete_analysis(analysis_id: UUID, current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_write_db)):
+    deleted = await delete_analysis_by_id(db, current_user['id'], analysis_id)
     
-    if not analysis:
+    if not deleted:
         raise HTTPException(status_code=404, detail='Analiza nije pronađena')
     
-    db.delete(analysis)
-    db.commit()
-    
     return {'success': True, 'message': 'Analiza je obrisana'}
-
@@ -0,0 +1,193 @@
+# Nightly pre-generation of analyses for users with new bills:
+#
+#     python -m RacunPlus.app.analysis.cli --days 30 --concurrency 4 --rpm 60
+#
+# Users whose bills changed since their last completed analysis get a fresh
+# monthly and category analysis, so /analysis/latest is served from stored rows
+# in the morning. Finished users are appended to the checkpoint file; a rerun
+# after a crash on the same day skips them, and a completed run deletes the file.
+# A checkpoint left by an earlier day's run is discarded.
+import argparse
+import asyncio
+import logging
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from typing import List, Optional, Set
+
+from sqlalchemy import func, select
+
+from RacunPlus.database import SessionLocal, dispose_engines
+from RacunPlus.bill.models import Bill
+from RacunPlus.app.analysis.models.analysis import Analysis
+from RacunPlus.app.analysis.database.analysis import create_analysis
+from RacunPlus.app.analysis.exceptions.analysis import NoBillsFoundError
+from RacunPlus.app.analysis.services.ai_service import FALLBACK_MODEL, close_ai_service, start_ai_service
+from RacunPlus.app.analysis.services.analysis import find_cached_analysis, load_analysis_input, result_values, run_ai
+from RacunPlus.app.analysis.services.local_engine import LOCAL_MODEL
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_TYPES = ('monthly', 'category')
+
+
+# Spaces request starts so no more than `rpm` begin in any minute.
+class RequestBudget:
+    def __init__(self, rpm: int):
+        self._interval = 60.0 / rpm
+        self._next = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self._interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class Checkpoint:
+    def __init__(self, path: Path, run_date: Optional[date] = None):
+        self.path = path
+        # First line of the file; users done by another day's run may have new bills since.
+        self.header = f'run {(run_date or date.today()).isoformat()}'
+        self.done: Set[str] = set()
+        if path.exists():
+            lines = [line.strip() for line in path.read_text().splitlines() if line.strip()]
+            if lines and lines[0] == self.header:
+                self.done = set(lines[1:])
+            else:
+                logger.info('discarding stale checkpoint %s', path)
+                path.unlink()
+
+    def mark(self, user_id: str):
+        self.done.add(user_id)
+        new = not self.path.exists()
+        with self.path.open('a') as f:
+            if new:
+                f.write(f'{self.header}\n')
+            f.write(f'{user_id}\n')
+
+    def finish(self):
+        self.path.unlink(missing_ok=True)
+
+
+async def users_with_new_bills(days: int, user_ids: Optional[List[str]] = None) -> List[str]:
+    last_analysis = select(
+        Analysis.user_id,
+        func.max(Analysis.created_at).label('created_at'),
+    ).where(
+        Analysis.status == 'completed',
+        # Fallback and local answers do not replace a model analysis.
+        Analysis.model_used.notin_((FALLBACK_MODEL, LOCAL_MODEL)),
+    ).group_by(Analysis.user_id).subquery()
+
+    stmt = select(Bill.user_id).outerjoin(
+        last_analysis, last_analysis.c.user_id == Bill.user_id
+    ).where(
+        Bill.reference_date >= date.today() - timedelta(days=days),
+        last_analysis.c.created_at.is_(None) | (Bill.created_at > last_analysis.c.created_at),
+    ).group_by(Bill.user_id).order_by(Bill.user_id)
+    if user_ids:
+        stmt = stmt.where(Bill.user_id.in_(user_ids))
+
+    async with SessionLocal() as db:
+        return [str(user_id) for user_id in (await db.scalars(stmt)).all()]
+
+
+async def generate_for_user(user_id: str, days: int, budget: RequestBudget, stats: dict):
+    # Not routed through generate_analysis: a nightly run must not use up the user's daily quota.
+    async with SessionLocal() as db:
+        for analysis_type in ANALYSIS_TYPES:
+            try:
+                data = await load_analysis_input(db, user_id, analysis_type, days)
+            except NoBillsFoundError:
+                stats['skipped'] += 1
+                continue
+
+            if await find_cached_analysis(db, user_id, data):
+                stats['cached'] += 1
+                continue
+
+            await budget.acquire()
+            result = await run_ai(data)
+            await create_analysis(db, Analysis(
+                user_id=user_id,
+                analysis_type=analysis_type,
+                period_start=data.start,
+                period_end=data.end,
+                total_amount=data.total_amount,
+                bills_count=len(data.bills),
+                status="completed",
+                **result_values(data, result),
+            ))
+            stats['generated'] += 1
+
+
+async def run_batch(
+    days: int,
+    concurrency: int,
+    rpm: int,
+    checkpoint: Checkpoint,
+    user_ids: Optional[List[str]] = None,
+) -> dict:
+    stats = {'users': 0, 'generated': 0, 'cached': 0, 'skipped': 0, 'failed': 0}
+    budget = RequestBudget(rpm)
+    slots = asyncio.Semaphore(concurrency)
+
+    async def process(user_id: str):
+        async with slots:
+            try:
+                await generate_for_user(user_id, days, budget, stats)
+            except Exception:
+                logger.exception('analysis batch failed for user %s', user_id)
+                stats['failed'] += 1
+                return
+            checkpoint.mark(user_id)
+
+    pending = [u for u in await users_with_new_bills(days, user_ids) if u not in checkpoint.done]
+    stats['users'] = len(pending)
+    await asyncio.gather(*(process(u) for u in pending))
+
+    # Failed users stay out of the checkpoint; keep it so they are retried by the next run.
+    if not stats['failed']:
+        checkpoint.finish()
+    return stats
+
+
+async def run(args) -> dict:
+    start_ai_service()
+    try:
+        return await run_batch(args.days, args.concurrency, args.rpm, Checkpoint(Path(args.checkpoint)), args.user_id)
+    finally:
+        await close_ai_service()
+        await dispose_engines()
+
+
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError('must be greater than 0')
+    return number
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Pre-generate analyses for users with new bills')
+    parser.add_argument('--days', type=positive_int, default=30)
+    parser.add_argument('--concurrency', type=positive_int, default=4)
+    parser.add_argument('--rpm', type=positive_int, default=60, help='Gemini requests per minute budget')
+    parser.add_argument('--checkpoint', default='analysis_batch.checkpoint')
+    parser.add_argument('--user-id', action='append', help='Only these users (repeatable)')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    stats = asyncio.run(run(args))
+    print(
+        f"users: {stats['users']}, generated: {stats['generated']}, cached: {stats['cached']}, "
+        f"skipped: {stats['skipped']}, failed: {stats['failed']}"
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,4 @@
 from RacunPlus.app.analysis.models.analysis import Analysis
-from datetime import date
 from typing import Optional, List, Tuple
 from uuid import UUID
 
@@ -15,13 +14,13 @@ async def create_analysis(db: AsyncSession, analysis: Analysis) -> Analysis:
     return analysis
 
 
-async def get_analysis_by_id(db: AsyncSession, user_id: int, analysis_id: UUID) -> Optional[Analysis]:
+async def get_analysis_by_id(db: AsyncSession, user_id: str, analysis_id: UUID) -> Optional[Analysis]:
     stmt = select(Analysis).where(Analysis.user_id == user_id, Analysis.id == analysis_id)
     res = await db.execute(stmt)
     return res.scalar_one_or_none()
 
 
-async def delete_analysis_by_id(db: AsyncSession, user_id: int, analysis_id: UUID) -> bool:
+async def delete_analysis_by_id(db: AsyncSession, user_id: str, analysis_id: UUID) -> bool:
     stmt = delete(Analysis).where(Analysis.user_id == user_id, Analysis.id == analysis_id)
     res = await db.execute(stmt)
     await db.commit()
@@ -30,7 +29,7 @@ async def delete_analysis_by_id(db: AsyncSession, user_id: int, analysis_id: UUI
 
 async def get_latest_analysis(
     db: AsyncSession,
-    user_id: int,
+    user_id: str,
     analysis_type: Optional[str] = None,
 ) -> Optional[Analysis]:
     stmt = select(Analysis).where(Analysis.user_id == user_id)
@@ -44,7 +43,7 @@ async def get_latest_analysis(
 
 async def get_analysis_history(
     db: AsyncSession,
-    user_id: int,
+    user_id: str,
     limit: int = 10,
     offset: int = 0,
 ) -> Tuple[List[Analysis], int]:
@@ -58,6 +57,12 @@ async def get_analysis_history(
     return items, total
 
 
-async def count_user_analyses_today(db: AsyncSession, user_id: int) -> int:
-    stmt = select(func.count()).where(Analysis.user_id == user_id,func.date(Analysis.created_at) == date.today())
-    return (await db.execute(stmt)).scalar_one()
+async def get_analysis_by_fingerprint(db: AsyncSession, user_id: str, fingerprint: str) -> Optional[Analysis]:
+    stmt = select(Analysis).where(
+        Analysis.user_id == user_id,
+        Analysis.fingerprint == fingerprint,
+        Analysis.status == "completed",
+    ).order_by(Analysis.created_at.desc()).limit(1)
+    return (await db.execute(stmt)).scalar_one_or_none()
+
+
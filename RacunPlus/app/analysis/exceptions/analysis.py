@@ -1,7 +1,9 @@
 class AnalysisError(Exception):
     pass
 class RateLimitExceededError(AnalysisError):
-    pass
+    def __init__(self, message, quota=None):
+        super().__init__(message)
+        self.quota = quota
 
 class InvalidAnalysisTypeError(AnalysisError):
     pass
@@ -1,5 +1,5 @@
 import uuid
-from sqlalchemy import Column, Integer, String, ForeignKey, Date, Text, Float, TIMESTAMP, func
+from sqlalchemy import Column, Integer, String, ForeignKey, Date, Text, Float, Index, TIMESTAMP, func
 from sqlalchemy.dialects.postgresql import JSONB, UUID
 from RacunPlus.database import Base
 
@@ -22,4 +22,11 @@ class Analysis(Base):
     tokens_used = Column(Integer, nullable=True)
     status = Column(String, default="completed", nullable=False)
     error_message = Column(Text, nullable=True)
+    # sha256 of the analysis input (see services.analysis.analysis_fingerprint); NULL for fallback results.
+    fingerprint = Column(String(64), nullable=True)
     created_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index('ix_analysis_user_id_created_at', user_id, created_at.desc()),
+        Index('ix_analysis_user_id_fingerprint', user_id, fingerprint),
+    )
@@ -0,0 +1,11 @@
+from sqlalchemy import Column, Date, ForeignKey, Integer
+from sqlalchemy.dialects.postgresql import UUID
+from RacunPlus.database import Base
+
+
+class AnalysisRateLimit(Base):
+    # One row per user: AI analyses started on `day`; the first request of a new day resets it.
+    __tablename__ = 'analysis_rate_limits'
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, nullable=False)
+    count = Column(Integer, nullable=False)
@@ -1,150 +1,268 @@
+import asyncio
 import json
-import google.generativeai as genai
-from typing import Dict, Any, List
+import time
+from google.ai import generativelanguage as glm
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
 
+from pydantic import ValidationError
+
+from RacunPlus import metrics
 from RacunPlus.settings import settings
+from RacunPlus.app.analysis.exceptions.analysis import AIResponseInvalidError
+from RacunPlus.app.analysis.schemas.analysis import CategoryInsights, MonthlyInsights
+from RacunPlus.app.analysis.services.local_engine import local_insights
+from RacunPlus.app.analysis.services.prompt_builder import build_category_prompt, build_monthly_prompt, estimate_tokens
+
+# Bump whenever the prompts below change, so cached analyses built from the old prompt are not reused.
+PROMPT_VERSION = 2
+# model_used of analyses produced by the local engine because the model failed.
+FALLBACK_MODEL = "fallback"
+
+gemini_seconds = metrics.histogram('gemini_request_seconds')
+prompt_tokens = metrics.histogram('gemini_prompt_tokens_estimated', buckets=(250, 500, 1000, 2000, 4000, 8000, 16000))
+gemini_timeouts = metrics.counter('gemini_timeouts_total')
+gemini_errors = metrics.counter('gemini_errors_total')
+breaker_skips = metrics.counter('gemini_breaker_skips_total')
+
+_in_flight = 0
+_waiting = 0
+_slots = None
+
+metrics.gauge('gemini_in_flight', lambda: _in_flight)
+metrics.gauge('gemini_waiting', lambda: _waiting)
+metrics.gauge('gemini_breaker_open', lambda: int(_service is not None and _service.breaker_open()))
+
+
+class GeminiUnavailableError(Exception):
+    pass
+
+
+def gemini_slots() -> asyncio.Semaphore:
+    # One semaphore per event loop; asyncio primitives cannot be shared between loops.
+    global _slots
+    loop = asyncio.get_running_loop()
+    if _slots is None or _slots[0] is not loop:
+        _slots = (loop, asyncio.Semaphore(settings.GEMINI_MAX_CONCURRENCY))
+    return _slots[1]
+
+
+def parse_insights(analysis_type: str, text: str, bills: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # A streamed answer is only known to be complete JSON at the end; check it against the schema before storing it.
+    try:
+        data = json.loads(text)
+        if analysis_type == "monthly":
+            data['total_amount'] = sum(b['amount'] for b in bills)
+            MonthlyInsights.model_validate(data)
+        else:
+            CategoryInsights.model_validate(data)
+    except (ValueError, TypeError, ValidationError) as e:
+        raise AIResponseInvalidError(str(e))
+    return data
+
+
+def build_request(prompt: str) -> glm.GenerateContentRequest:
+    return glm.GenerateContentRequest(
+        model=f"models/{settings.GEMINI_MODEL}",
+        contents=[glm.Content(role="user", parts=[glm.Part(text=prompt)])],
+        generation_config=glm.GenerationConfig(temperature=0.7, response_mime_type="application/json"),
+    )
+
+
+def response_text(response: glm.GenerateContentResponse) -> str:
+    # A blocked answer, or a stream chunk with only a finish reason or usage, has no parts.
+    if not response.candidates:
+        return ""
+    return "".join(part.text for part in response.candidates[0].content.parts)
+
+
+class AIResult:
+    def __init__(self, insights: Dict[str, Any], model_used: str, prompt: str, tokens_used: Optional[int] = None):
+        self.insights = insights
+        self.model_used = model_used
+        self.prompt = prompt
+        self.tokens_used = tokens_used
 
 
 class GeminiAIService:
     def __init__(self):
-        genai.configure(api_key=settings.GEMINI_API_KEY)
-        self.model = genai.GenerativeModel(settings.GEMINI_MODEL)
+        self.client: Optional[glm.GenerativeServiceAsyncClient] = None
+        self._failures = 0
+        self._open_until = 0.0
+
+    def connect(self) -> glm.GenerativeServiceAsyncClient:
+        # Build the async gRPC client up front instead of on the first request.
+        if self.client is None:
+            self.client = glm.GenerativeServiceAsyncClient(client_options={"api_key": settings.GEMINI_API_KEY})
+        return self.client
+
+    async def aclose(self):
+        client, self.client = self.client, None
+        if client is not None:
+            await client.transport.close()
+
+    def breaker_open(self) -> bool:
+        return time.monotonic() < self._open_until
+
+    def _check_breaker(self):
+        # After repeated failures the model is skipped for a while, instead of every
+        # request waiting out the timeout before falling back.
+        if self.breaker_open():
+            breaker_skips.inc()
+            raise GeminiUnavailableError()
+
+    def _record(self, ok: bool):
+        if ok:
+            self._failures = 0
+            return
+        self._failures += 1
+        if self._failures >= settings.GEMINI_BREAKER_FAILURES:
+            self._failures = 0
+            self._open_until = time.monotonic() + settings.GEMINI_BREAKER_SECONDS
 
-    def generate(self, prompt: str) -> dict:
-        response = self.model.generate_content(
-            prompt,
-            generation_config={
-                "temperature": 0.7,
-                "response_mime_type": "application/json",
-            },
-        )
+    async def generate(self, prompt: str) -> Tuple[dict, Optional[int]]:
+        self._check_breaker()
+        # The timeout covers waiting for a free slot too, so a backlog of slow calls
+        # turns into fast fallbacks instead of piling up.
+        try:
+            result = await asyncio.wait_for(self._generate(prompt), timeout=settings.GEMINI_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            gemini_timeouts.inc()
+            self._record(False)
+            raise
+        except Exception:
+            gemini_errors.inc()
+            self._record(False)
+            raise
+        self._record(True)
+        return result
+
+    async def _generate(self, prompt: str) -> Tuple[dict, Optional[int]]:
+        global _in_flight, _waiting
+        prompt_tokens.observe(estimate_tokens(prompt))
+        slots = gemini_slots()
+        _waiting += 1
+        try:
+            await slots.acquire()
+        finally:
+            _waiting -= 1
+
+        _in_flight += 1
+        started = time.perf_counter()
+        try:
+            response = await self.connect().generate_content(
+                build_request(prompt),
+                timeout=settings.GEMINI_TIMEOUT_SECONDS,
+            )
+        finally:
+            gemini_seconds.observe(time.perf_counter() - started)
+            _in_flight -= 1
+            slots.release()
+
+        return json.loads(response_text(response)), response.usage_metadata.total_token_count or None
 
-        return json.loads(response.text)
+    async def stream(self, prompt: str) -> AsyncIterator[Tuple[str, Optional[int]]]:
+        # Yields (text, total_tokens); Gemini reports the token count on the last chunks only.
+        # GEMINI_TIMEOUT_SECONDS bounds the wait for a slot and between chunks, GEMINI_STREAM_TIMEOUT_SECONDS the whole call.
+        global _in_flight, _waiting
+        self._check_breaker()
+        prompt_tokens.observe(estimate_tokens(prompt))
+        slots = gemini_slots()
+        _waiting += 1
+        try:
+            await self._idle(slots.acquire())
+        finally:
+            _waiting -= 1
+
+        _in_flight += 1
+        started = time.perf_counter()
+        try:
+            response = await self._idle(self.connect().stream_generate_content(
+                build_request(prompt),
+                timeout=settings.GEMINI_STREAM_TIMEOUT_SECONDS,
+            ))
+            chunks = response.__aiter__()
+            while True:
+                try:
+                    chunk = await self._idle(chunks.__anext__())
+                except StopAsyncIteration:
+                    break
+                yield response_text(chunk), chunk.usage_metadata.total_token_count or None
+            self._record(True)
+        except asyncio.TimeoutError:
+            self._record(False)
+            raise
+        except Exception:
+            gemini_errors.inc()
+            self._record(False)
+            raise
+        finally:
+            gemini_seconds.observe(time.perf_counter() - started)
+            _in_flight -= 1
+            slots.release()
+
+    async def _idle(self, awaitable):
+        try:
+            return await asyncio.wait_for(awaitable, timeout=settings.GEMINI_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            gemini_timeouts.inc()
+            raise
 
-    def generate_monthly_analysis(self, bills: List[Dict[str, Any]]) -> Dict[str, Any]:
+    async def generate_monthly_analysis(self, bills: List[Dict[str, Any]]) -> AIResult:
         if not bills:
-            return {
+            return AIResult({
                 "summary": "No bills found for this period",
                 "total_amount": 0,
                 "breakdown": [],
                 "recommendations": ["Add bills to get analysis"]
-            }
+            }, FALLBACK_MODEL, "")
 
         total = sum(b['amount'] for b in bills)
-        breakdown = []
-        for bill in bills:
-            breakdown.append({
-                "provider": bill['beneficiary_name'],
-                "amount": bill['amount'],
-                "date": str(bill['reference_date'])
-            })
-
-        prompt = f"""
-Analiziraj ove račune za ovaj mjesec i dao detaljnu analizu. 
-Vrati JSON sa sljedećim poljima:
-- summary: kratka analiza (tekst)
-- total_amount: ukupan iznos
-- breakdown: lista sa provajderima
-- recommendations: lista sa preporukama (min 3)
-
-RAČUNI:
-{json.dumps(breakdown, ensure_ascii=False)}
-
-UKUPNO: €{total:.2f}
-
-Nastavi se kao finansijski savjetnik i dao specifične preporuke kako smanjiti troškove.
-Vrati SAMO JSON, bez dodatnog teksta."""
+        prompt = build_monthly_prompt(bills)
 
         try:
-            response_data = self.generate(prompt)
+            response_data, tokens_used = await self.generate(prompt)
             response_data['total_amount'] = total
-            return response_data
-        except Exception as e:
-            return {
-                "summary": f"Analiza {len(bills)} računa za ovaj mjesec",
-                "total_amount": total,
-                "breakdown": breakdown,
-                "recommendations": [
-                    "Pregled vaših računa može pokazati mogućnosti za uštedu",
-                    "Razmotriti bundling usluga",
-                    "Provjeriti da li ste na najboljoj tarifi"
-                ]
-            }
-
-    def generate_category_analysis(self, bills: List[Dict[str, Any]]) -> Dict[str, Any]:
+            return AIResult(response_data, settings.GEMINI_MODEL, prompt, tokens_used)
+        except Exception:
+            return self.fallback("monthly", bills, prompt)
+
+    async def generate_category_analysis(self, bills: List[Dict[str, Any]]) -> AIResult:
         if not bills:
-            return {
+            return AIResult({
                 "summary": "No bills found for this period",
                 "categories": [],
                 "recommendations": ["Add bills to get analysis"]
-            }
-
-        categories_dict = {}
-        total = 0
-        bill_details = []
-        
-        for bill in bills:
-            cat = bill['beneficiary_name']
-            if cat not in categories_dict:
-                categories_dict[cat] = []
-            categories_dict[cat].append(bill['amount'])
-            bill_details.append({
-                "name": cat,
-                "amount": bill['amount'],
-                "date": str(bill['reference_date'])
-            })
-            total += bill['amount']
-
-        categories_summary = []
-        for cat_name, amounts in categories_dict.items():
-            cat_total = sum(amounts)
-            percentage = (cat_total / total * 100) if total > 0 else 0
-            categories_summary.append({
-                "category": cat_name,
-                "total": cat_total,
-                "percentage": percentage,
-                "count": len(amounts)
-            })
-
-        prompt = f"""
-Analiziraj ove rashode po kategorijama i dao detaljnu analizu.
-Vrati JSON sa sljedećim poljima:
-- summary: kratka analiza (tekst)
-- categories: lista sa kategorijama, total_amount, percentage, insight
-- recommendations: lista sa preporukama (min 3)
-
-RASHODI PO KATEGORIJAMA:
-{json.dumps(categories_summary, ensure_ascii=False)}
-
-DETALJNI RASHODI:
-{json.dumps(bill_details, ensure_ascii=False)}
-
-UKUPNO: €{total:.2f}
-
-Kao financijski analitičar, dao specifične preporuke kako smanjiti troškove po kategorijama.
-Vrati SAMO JSON, bez dodatnog teksta."""
+            }, FALLBACK_MODEL, "")
+
+        prompt = build_category_prompt(bills)
 
         try:
-            response_data = self.generate(prompt)
-            return response_data
-        except Exception as e:
-            categories = []
-            for cat_name, amounts in categories_dict.items():
-                cat_total = sum(amounts)
-                percentage = (cat_total / total * 100) if total > 0 else 0
-                categories.append({
-                    "name": cat_name,
-                    "total_amount": cat_total,
-                    "percentage": round(percentage, 1),
-                    "insight": f"{cat_name} je €{cat_total:.2f} ({percentage:.1f}%)"
-                })
-
-            return {
-                "summary": f"Ukupno €{total:.2f} u {len(categories_dict)} kategorija",
-                "categories": sorted(categories, key=lambda x: x['total_amount'], reverse=True),
-                "recommendations": [
-                    "Analizirati najveće rashode",
-                    "Potražiti alternative za skupo usluge",
-                    "Razmotriti pregovaranje sa provajderima"
-                ]
-            }
+            response_data, tokens_used = await self.generate(prompt)
+            return AIResult(response_data, settings.GEMINI_MODEL, prompt, tokens_used)
+        except Exception:
+            return self.fallback("category", bills, prompt)
+
+    def fallback(self, analysis_type: str, bills: List[Dict[str, Any]], prompt: str) -> AIResult:
+        return AIResult(local_insights(analysis_type, bills), FALLBACK_MODEL, prompt)
+
+
+_service: Optional[GeminiAIService] = None
+
+
+def start_ai_service() -> GeminiAIService:
+    global _service
+    _service = GeminiAIService()
+    _service.connect()
+    return _service
+
+
+def get_ai_service() -> GeminiAIService:
+    # One client per process, created by the app lifespan; scripts get one on first use.
+    return _service or start_ai_service()
+
+
+async def close_ai_service():
+    global _service
+    service, _service = _service, None
+    if service is not None:
+        await service.aclose()
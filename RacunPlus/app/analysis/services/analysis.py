@@ -1,67 +1,169 @@
+import hashlib
+import json
 from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
 from fastapi import HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from RacunPlus import metrics
 from RacunPlus.settings import settings
 from RacunPlus.app.analysis.models.analysis import Analysis
-from RacunPlus.app.analysis.services.ai_service import GeminiAIService
+from RacunPlus.app.analysis.database.analysis import create_analysis, get_analysis_by_fingerprint
+from RacunPlus.app.analysis.services.ai_service import FALLBACK_MODEL, PROMPT_VERSION, AIResult, get_ai_service
 from RacunPlus.app.analysis.services.data_aggregator import fetch_user_bills
+from RacunPlus.app.analysis.services.local_engine import LOCAL_MODEL, local_insights
+from RacunPlus.app.analysis.services.rate_limit import Quota, current_quota, get_rate_limiter
 from RacunPlus.app.analysis.exceptions.analysis import RateLimitExceededError, NoBillsFoundError
 
+cache_hits = metrics.counter('analysis_cache_hits_total')
+cache_misses = metrics.counter('analysis_cache_misses_total')
+rate_limited = metrics.counter('analysis_rate_limited_total')
 
-def count_user_analyses_today(db: Session, user_id: str) -> int:
-    today = date.today()
-    count = db.query(func.count(Analysis.id)).filter(
-        Analysis.user_id == user_id,
-        func.date(Analysis.created_at) == today,
-        Analysis.status == "completed"
-    ).scalar()
-    return count or 0
 
+def _hit_rate() -> float:
+    hits, misses = cache_hits.snapshot(), cache_misses.snapshot()
+    return round(hits / (hits + misses), 4) if hits + misses else 0.0
+
+
+metrics.gauge('analysis_cache_hit_rate', _hit_rate)
 
-def generate_analysis(
-    db: Session,
-    user_id: str,
-    analysis_type: str,
-    days: int,
-):
-    today_count = count_user_analyses_today(db, user_id)
-    if today_count >= settings.ANALYSIS_RATE_LIMIT:
-        raise RateLimitExceededError("Daily analysis limit reached")
 
-    bills, start, end = fetch_user_bills(db, user_id, days)
+def analysis_fingerprint(analysis_type: str, bills: List[Dict[str, Any]]) -> str:
+    # Everything the prompt is built from, including the token budget that picks its detail level;
+    # the same fingerprint means the model would see the same input.
+    items = sorted(
+        (b['id'], b['amount'], str(b['reference_date']), b['beneficiary_name'])
+        for b in bills
+    )
+    payload = json.dumps([
+        analysis_type, settings.GEMINI_MODEL, PROMPT_VERSION, settings.ANALYSIS_PROMPT_TOKEN_BUDGET, items,
+    ])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+# The bills an analysis is generated from, loaded once and shared by the sync and job paths.
+class AnalysisInput:
+    def __init__(self, analysis_type: str, bills: List[Dict[str, Any]], start: date, end: date):
+        self.analysis_type = analysis_type
+        self.bills = bills
+        self.start = start
+        self.end = end
+        self.fingerprint = analysis_fingerprint(analysis_type, bills)
+        self.total_amount = sum(b['amount'] for b in bills)
+
+
+async def load_analysis_input(db: AsyncSession, user_id: str, analysis_type: str, days: int) -> AnalysisInput:
+    bills, start, end = await fetch_user_bills(db, user_id, days)
 
     if not bills:
         raise NoBillsFoundError("No bills found for this period")
 
-    total_amount = sum(b['amount'] for b in bills)
+    return AnalysisInput(analysis_type, bills, start, end)
+
 
-    ai = GeminiAIService()
-    
-    if analysis_type == "monthly":
-        ai_response = ai.generate_monthly_analysis(bills)
-    elif analysis_type == "category":
-        ai_response = ai.generate_category_analysis(bills)
+async def find_cached_analysis(db: AsyncSession, user_id: str, data: AnalysisInput) -> Optional[Analysis]:
+    # Repeated clicks over unchanged bills reuse the stored result and do not count against the limit.
+    cached = await get_analysis_by_fingerprint(db, user_id, data.fingerprint)
+    if cached:
+        cache_hits.inc()
+    else:
+        cache_misses.inc()
+    return cached
+
+
+async def check_rate_limit(db: AsyncSession, user_id: str) -> Quota:
+    # Takes the slot up front: an analysis that later fails or falls back still counts.
+    quota = await get_rate_limiter().hit(db, user_id)
+    if not quota.allowed:
+        rate_limited.inc()
+        raise RateLimitExceededError("Daily analysis limit reached", quota)
+    return quota
+
+
+async def run_ai(data: AnalysisInput) -> AIResult:
+    ai = get_ai_service()
+
+    if data.analysis_type == "monthly":
+        return await ai.generate_monthly_analysis(data.bills)
+    elif data.analysis_type == "category":
+        return await ai.generate_category_analysis(data.bills)
     else:
         raise HTTPException(status_code=400, detail="Invalid analysis type")
 
+
+def run_local(data: AnalysisInput) -> AIResult:
+    return AIResult(local_insights(data.analysis_type, data.bills), LOCAL_MODEL, "")
+
+
+def result_fingerprint(data: AnalysisInput, result: AIResult) -> Optional[str]:
+    # Fallback answers are not cached, so the next click tries the model again;
+    # local ones are cheaper to recompute than to look up.
+    return data.fingerprint if result.model_used not in (FALLBACK_MODEL, LOCAL_MODEL) else None
+
+
+def result_values(data: AnalysisInput, result: AIResult) -> dict:
+    return {
+        'prompt': result.prompt,
+        'ai_response': result.insights,
+        'model_used': result.model_used,
+        'tokens_used': result.tokens_used,
+        'fingerprint': result_fingerprint(data, result),
+    }
+
+
+async def generate_analysis(
+    db: AsyncSession,
+    user_id: str,
+    analysis_type: str,
+    days: int,
+) -> Tuple[Analysis, bool, Quota]:
+    data = await load_analysis_input(db, user_id, analysis_type, days)
+
+    cached = await find_cached_analysis(db, user_id, data)
+    if cached:
+        return cached, True, await current_quota(db, user_id)
+
+    quota = await check_rate_limit(db, user_id)
+
+    result = await run_ai(data)
+
+    analysis = Analysis(
+        user_id=user_id,
+        analysis_type=analysis_type,
+        period_start=data.start,
+        period_end=data.end,
+        total_amount=data.total_amount,
+        bills_count=len(data.bills),
+        status="completed",
+        **result_values(data, result),
+    )
+
+    return await create_analysis(db, analysis), False, quota
+
+
+async def generate_local_analysis(
+    db: AsyncSession,
+    user_id: str,
+    analysis_type: str,
+    days: int,
+) -> Analysis:
+    # The local engine answers in milliseconds, so there is no cache lookup or rate limit.
+    data = await load_analysis_input(db, user_id, analysis_type, days)
+    result = run_local(data)
+
     analysis = Analysis(
         user_id=user_id,
         analysis_type=analysis_type,
-        period_start=start,
-        period_end=end,
-        total_amount=total_amount,
-        bills_count=len(bills),
-        prompt="",
-        ai_response=ai_response,
-        status="completed"
+        period_start=data.start,
+        period_end=data.end,
+        total_amount=data.total_amount,
+        bills_count=len(data.bills),
+        status="completed",
+        **result_values(data, result),
     )
 
-    db.add(analysis)
-    db.commit()
-    db.refresh(analysis)
-    return analysis
+    return await create_analysis(db, analysis)
 
 
 def analysis_to_response(analysis: Analysis) -> dict:
@@ -73,5 +175,7 @@ def analysis_to_response(analysis: Analysis) -> dict:
         "total_amount": analysis.total_amount,
         "bills_count": analysis.bills_count,
         "insights": analysis.ai_response,
+        "status": analysis.status,
+        "error_message": analysis.error_message,
         "created_at": analysis.created_at.isoformat(),
     }
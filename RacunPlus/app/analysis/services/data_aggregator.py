@@ -2,8 +2,8 @@ from datetime import date, timedelta
 from typing import List, Tuple, Dict, Any
 import uuid
 
-from sqlalchemy import select
-from sqlalchemy.orm import Session
+from sqlalchemy import case, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from RacunPlus.bill.models import Bill
 
@@ -20,8 +20,13 @@ def detect_category(provider: str) -> str:
     return CATEGORY_MAP.get(provider.strip(), "Other")
 
 
-def fetch_user_bills(
-    db: Session,
+def category_expression(provider_column):
+    # SQL twin of detect_category, for grouping inside the database.
+    return case(CATEGORY_MAP, value=func.trim(provider_column), else_="Other")
+
+
+async def fetch_user_bills(
+    db: AsyncSession,
     user_id: str,
     days: int,
 ) -> Tuple[List[Dict[str, Any]], date, date]:
@@ -29,11 +34,11 @@ def fetch_user_bills(
     end = date.today()
     start = end - timedelta(days=days)
 
-    bills = db.query(Bill).filter(
+    bills = (await db.scalars(select(Bill).where(
         Bill.user_id == user_id,
         Bill.reference_date >= start,
         Bill.reference_date <= end,
-    ).all()
+    ))).all()
     
     bills_data = []
     for bill in bills:
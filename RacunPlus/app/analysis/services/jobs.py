@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import uuid
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from RacunPlus import metrics
+from RacunPlus.database import SessionLocal
+from RacunPlus.settings import settings
+from RacunPlus.app.analysis.models.analysis import Analysis
+from RacunPlus.app.analysis.database.analysis import create_analysis
+from RacunPlus.app.analysis.services.rate_limit import Quota, current_quota, get_rate_limiter
+from RacunPlus.app.analysis.services.analysis import (
+    AnalysisInput,
+    check_rate_limit,
+    find_cached_analysis,
+    load_analysis_input,
+    result_values,
+    run_ai,
+)
+
+logger = logging.getLogger(__name__)
+
+jobs_completed = metrics.counter('analysis_jobs_completed_total')
+jobs_failed = metrics.counter('analysis_jobs_failed_total')
+jobs_rejected = metrics.counter('analysis_jobs_rejected_total')
+
+_queue: Optional[asyncio.Queue] = None
+_workers: List[asyncio.Task] = []
+_running: Set[uuid.UUID] = set()
+_finished: Dict[uuid.UUID, asyncio.Event] = {}
+
+metrics.gauge('analysis_queue_depth', lambda: _queue.qsize() if _queue is not None else 0)
+metrics.gauge('analysis_jobs_running', lambda: len(_running))
+
+
+class QueueFullError(Exception):
+    pass
+
+
+def start_workers():
+    global _queue
+    _queue = asyncio.Queue(maxsize=settings.ANALYSIS_QUEUE_SIZE)
+    _workers[:] = [asyncio.create_task(_worker()) for _ in range(settings.ANALYSIS_WORKERS)]
+
+
+async def stop_workers():
+    global _queue
+    # Jobs that never finished would stay pending forever; report them as failed instead.
+    unfinished = list(_running)
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+
+    while _queue is not None and not _queue.empty():
+        analysis_id, _, _ = _queue.get_nowait()
+        unfinished.append(analysis_id)
+    _queue = None
+
+    if unfinished:
+        async with SessionLocal() as db:
+            await db.execute(
+                update(Analysis)
+                .where(Analysis.id.in_(unfinished), Analysis.status.in_(("pending", "running")))
+                .values(status="failed", error_message="Server je ugašen prije završetka analize")
+            )
+            await db.commit()
+    for event in _finished.values():
+        event.set()
+    _finished.clear()
+
+
+def enqueue(analysis_id: uuid.UUID, user_id: str, data: AnalysisInput):
+    if _queue is None:
+        start_workers()
+    try:
+        _queue.put_nowait((analysis_id, user_id, data))
+    except asyncio.QueueFull:
+        jobs_rejected.inc()
+        raise QueueFullError()
+    _finished[analysis_id] = asyncio.Event()
+
+
+# Job mode of generate_analysis: stores a pending row and leaves the AI call to the workers.
+async def submit_analysis(db: AsyncSession, user_id: str, analysis_type: str, days: int) -> Tuple[Analysis, bool, Quota]:
+    data = await load_analysis_input(db, user_id, analysis_type, days)
+
+    cached = await find_cached_analysis(db, user_id, data)
+    if cached:
+        return cached, True, await current_quota(db, user_id)
+
+    # Checked before taking a quota slot, so a full queue does not use up the user's limit.
+    if _queue is not None and _queue.full():
+        jobs_rejected.inc()
+        raise QueueFullError()
+    quota = await check_rate_limit(db, user_id)
+
+    analysis = await create_analysis(db, Analysis(
+        user_id=user_id,
+        analysis_type=analysis_type,
+        period_start=data.start,
+        period_end=data.end,
+        total_amount=data.total_amount,
+        bills_count=len(data.bills),
+        prompt="",
+        ai_response={},
+        status="pending",
+    ))
+
+    try:
+        enqueue(analysis.id, user_id, data)
+    except QueueFullError:
+        # The queue filled up after the check above; the job never runs, so the slot goes back.
+        await _set_status(analysis.id, user_id, status="failed", error_message="Red za analize je pun")
+        await get_rate_limiter().release(db, user_id)
+        raise
+
+    return analysis, False, quota
+
+
+async def wait_for_job(analysis_id: uuid.UUID, timeout: float) -> bool:
+    # False when the job is unknown in this process or still running after timeout.
+    event = _finished.get(analysis_id)
+    if event is None:
+        # Owned by another worker process, already finished, or left pending by a crash:
+        # nothing to wait on here, so sleep out the timeout before the caller re-reads the row.
+        await asyncio.sleep(timeout)
+        return False
+    try:
+        await asyncio.wait_for(event.wait(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+
+async def _set_status(analysis_id: uuid.UUID, user_id: str, **values):
+    async with SessionLocal() as db:
+        # Marks the user as a recent writer, so their next poll reads the result from the primary.
+        db.info['user_id'] = user_id
+        await db.execute(update(Analysis).where(Analysis.id == analysis_id).values(**values))
+        await db.commit()
+
+
+async def _worker():
+    while True:
+        analysis_id, user_id, data = await _queue.get()
+        _running.add(analysis_id)
+        try:
+            await _set_status(analysis_id, user_id, status="running")
+            result = await run_ai(data)
+            await _set_status(analysis_id, user_id, status="completed", **result_values(data, result))
+            jobs_completed.inc()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception('analysis job %s failed', analysis_id)
+            jobs_failed.inc()
+            try:
+                await _set_status(analysis_id, user_id, status="failed", error_message=str(e))
+            except Exception:
+                logger.exception('could not mark analysis job %s as failed', analysis_id)
+        finally:
+            _running.discard(analysis_id)
+            event = _finished.pop(analysis_id, None)
+            if event is not None:
+                event.set()
+            _queue.task_done()
@@ -0,0 +1,164 @@
+# Analysis computed from the bills alone, in the same MonthlyInsights / CategoryInsights
+# shapes as Gemini; serves `engine=local` requests and the fallback when Gemini is slow or down.
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from RacunPlus.app.analysis.services.prompt_builder import find_outliers
+
+# model_used of analyses requested with engine=local.
+LOCAL_MODEL = "local"
+
+# Month-over-month changes smaller than this are not worth a remark.
+MONTH_CHANGE_THRESHOLD = 0.15
+# A category above this share of the total gets its own recommendation.
+DOMINANT_SHARE = 0.5
+
+GENERIC_RECOMMENDATIONS = [
+    "Provjeriti da li ste na najboljoj tarifi kod svakog provajdera",
+    "Uporediti ponude drugih provajdera za najveće stavke",
+    "Redovno pratiti račune kako biste na vrijeme uočili odstupanja",
+]
+
+
+# All aggregates come from one pass over the bills.
+class Aggregates:
+    def __init__(self, bills: List[Dict[str, Any]]):
+        self.total = 0.0
+        self.count = len(bills)
+        self.unpaid_total = 0.0
+        self.unpaid_count = 0
+        self.by_category = defaultdict(float)
+        self.by_provider = defaultdict(float)
+        self.provider_category: Dict[str, str] = {}
+        self.by_month = defaultdict(float)
+        self.category_by_month = defaultdict(lambda: defaultdict(float))
+
+        for b in bills:
+            amount = b['amount']
+            month = str(b['reference_date'])[:7]
+            self.total += amount
+            self.by_category[b['category']] += amount
+            self.by_provider[b['beneficiary_name']] += amount
+            self.provider_category[b['beneficiary_name']] = b['category']
+            self.by_month[month] += amount
+            self.category_by_month[b['category']][month] += amount
+            if b['status'] != 'paid':
+                self.unpaid_total += amount
+                self.unpaid_count += 1
+
+        self.months = sorted(self.by_month)
+        self.outliers = find_outliers(bills)
+
+    def share(self, amount: float) -> float:
+        return amount / self.total if self.total > 0 else 0.0
+
+    def month_change(self, by_month: Optional[Dict[str, float]] = None) -> Optional[Dict[str, Any]]:
+        by_month = self.by_month if by_month is None else by_month
+        if len(self.months) < 2:
+            return None
+        previous, current = self.months[-2], self.months[-1]
+        before, after = by_month.get(previous, 0.0), by_month.get(current, 0.0)
+        if before <= 0:
+            return None
+        return {'previous': previous, 'current': current, 'change': (after - before) / before}
+
+
+def _ranked(amounts: Dict[str, float]) -> List[tuple]:
+    return sorted(amounts.items(), key=lambda item: item[1], reverse=True)
+
+
+def _change_sentence(change: Optional[Dict[str, Any]]) -> str:
+    if change is None or abs(change['change']) < MONTH_CHANGE_THRESHOLD:
+        return ""
+    direction = "porasli" if change['change'] > 0 else "pali"
+    return f" Troškovi su u {change['current']} {direction} za {abs(change['change']) * 100:.0f}% u odnosu na {change['previous']}."
+
+
+def _recommendations(agg: Aggregates) -> List[str]:
+    recommendations = []
+
+    if agg.by_category:
+        name, amount = _ranked(agg.by_category)[0]
+        if len(agg.by_category) > 1 and agg.share(amount) >= DOMINANT_SHARE:
+            recommendations.append(
+                f"Kategorija {name} čini {agg.share(amount) * 100:.0f}% troškova — tu je najveći prostor za uštedu"
+            )
+
+    change = agg.month_change()
+    if change is not None and change['change'] >= MONTH_CHANGE_THRESHOLD:
+        recommendations.append(
+            f"Troškovi su u {change['current']} porasli za {change['change'] * 100:.0f}% — provjerite koji računi su uzrok"
+        )
+
+    for outlier in agg.outliers[:2]:
+        recommendations.append(
+            f"Račun kod {outlier['provider']} od €{outlier['amount']:.2f} ({outlier['date']}) je "
+            f"{outlier['amount'] / outlier['usual']:.1f}x veći od uobičajenog (€{outlier['usual']:.2f}) — provjerite ga"
+        )
+
+    if agg.unpaid_count:
+        recommendations.append(
+            f"Imate {agg.unpaid_count} neplaćenih računa ukupno €{agg.unpaid_total:.2f} — platite ih na vrijeme da izbjegnete kamate"
+        )
+
+    if 'Phone' in agg.by_category and 'Internet' in agg.by_category:
+        recommendations.append("Razmotriti paket usluga (bundling) za telefon i internet kod istog provajdera")
+
+    for generic in GENERIC_RECOMMENDATIONS:
+        if len(recommendations) >= 3:
+            break
+        recommendations.append(generic)
+    return recommendations
+
+
+def monthly_insights(bills: List[Dict[str, Any]]) -> Dict[str, Any]:
+    agg = Aggregates(bills)
+    providers = _ranked(agg.by_provider)
+
+    summary = f"Ukupno €{agg.total:.2f} u {agg.count} računa kod {len(providers)} provajdera."
+    if providers:
+        name, amount = providers[0]
+        summary += f" Najveći trošak je {name} sa €{amount:.2f} ({agg.share(amount) * 100:.0f}%)."
+    summary += _change_sentence(agg.month_change())
+
+    return {
+        "summary": summary,
+        "total_amount": agg.total,
+        "breakdown": [
+            {"provider": name, "category": agg.provider_category[name], "amount": round(amount, 2)}
+            for name, amount in providers
+        ],
+        "recommendations": _recommendations(agg),
+    }
+
+
+def category_insights(bills: List[Dict[str, Any]]) -> Dict[str, Any]:
+    agg = Aggregates(bills)
+    categories = []
+    for name, amount in _ranked(agg.by_category):
+        percentage = agg.share(amount) * 100
+        insight = f"{name} je €{amount:.2f} ({percentage:.1f}%)."
+        insight += _change_sentence(agg.month_change(agg.category_by_month[name]))
+        categories.append({
+            "name": name,
+            "total_amount": round(amount, 2),
+            "percentage": round(percentage, 1),
+            "insight": insight,
+        })
+
+    summary = f"Ukupno €{agg.total:.2f} u {len(categories)} kategorija."
+    if categories:
+        summary += f" Najveća kategorija je {categories[0]['name']} ({categories[0]['percentage']:.0f}%)."
+    summary += _change_sentence(agg.month_change())
+
+    return {
+        "summary": summary,
+        "categories": categories,
+        "recommendations": _recommendations(agg),
+    }
+
+
+def local_insights(analysis_type: str, bills: List[Dict[str, Any]]) -> Dict[str, Any]:
+    if analysis_type == "monthly":
+        return monthly_insights(bills)
+    return category_insights(bills)
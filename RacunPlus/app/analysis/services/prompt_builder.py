@@ -0,0 +1,135 @@
+import json
+import math
+import statistics
+from collections import defaultdict
+from typing import Any, Dict, List
+
+from RacunPlus.settings import settings
+
+# Each level trades detail for size; the first one that fits the token budget is used.
+DETAIL_LEVELS = [
+    {'providers': 15, 'top_bills': 10, 'outliers': 10},
+    {'providers': 10, 'top_bills': 5, 'outliers': 5},
+    {'providers': 5, 'top_bills': 3, 'outliers': 3},
+    {'providers': 3, 'top_bills': 0, 'outliers': 0},
+]
+
+# A bill is unusual when it is this many times its provider's median (providers with 3+ bills).
+OUTLIER_FACTOR = 2.0
+
+MONTHLY_INSTRUCTIONS = """
+Analiziraj ove račune za ovaj period i daj detaljnu analizu.
+Vrati JSON sa sljedećim poljima:
+- summary: kratka analiza (tekst)
+- total_amount: ukupan iznos
+- breakdown: lista sa provajderima (provider, category, amount)
+- recommendations: lista sa preporukama (min 3)
+"""
+
+CATEGORY_INSTRUCTIONS = """
+Analiziraj ove rashode po kategorijama i daj detaljnu analizu.
+Vrati JSON sa sljedećim poljima:
+- summary: kratka analiza (tekst)
+- categories: lista sa kategorijama (name, total_amount, percentage, insight)
+- recommendations: lista sa preporukama (min 3)
+"""
+
+MONTHLY_CLOSING = """Nastavi kao finansijski savjetnik i daj specifične preporuke kako smanjiti troškove.
+Vrati SAMO JSON, bez dodatnog teksta."""
+
+CATEGORY_CLOSING = """Kao finansijski analitičar, daj specifične preporuke kako smanjiti troškove po kategorijama.
+Vrati SAMO JSON, bez dodatnog teksta."""
+
+
+def estimate_tokens(text: str) -> int:
+    # Gemini averages roughly 4 characters per token; rounding up keeps the estimate on the safe side.
+    return math.ceil(len(text) / 4)
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _group(bills: List[Dict[str, Any]], key: str) -> List[Dict[str, Any]]:
+    groups = defaultdict(list)
+    for b in bills:
+        groups[b[key]].append(b['amount'])
+    return sorted(
+        ({'name': name, 'total': round(sum(amounts), 2), 'count': len(amounts)} for name, amounts in groups.items()),
+        key=lambda g: g['total'],
+        reverse=True,
+    )
+
+
+def find_outliers(bills: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    by_provider = defaultdict(list)
+    for b in bills:
+        by_provider[b['beneficiary_name']].append(b)
+
+    outliers = []
+    for provider, items in by_provider.items():
+        if len(items) < 3:
+            continue
+        median = statistics.median(b['amount'] for b in items)
+        for b in items:
+            if median > 0 and b['amount'] >= OUTLIER_FACTOR * median:
+                outliers.append({
+                    'provider': provider,
+                    'amount': b['amount'],
+                    'date': str(b['reference_date']),
+                    'usual': round(median, 2),
+                })
+    return sorted(outliers, key=lambda o: o['amount'] / o['usual'], reverse=True)
+
+
+def _data_section(bills: List[Dict[str, Any]], level: dict) -> str:
+    total = sum(b['amount'] for b in bills)
+    providers = _group(bills, 'beneficiary_name')
+    shown = providers[:level['providers']]
+    rest = providers[level['providers']:]
+    months = [{'month': str(b['reference_date'])[:7], 'amount': b['amount']} for b in bills]
+
+    lines = [
+        f"UKUPNO: €{total:.2f} u {len(bills)} računa",
+        f"PO KATEGORIJAMA: {_dumps(_group(bills, 'category'))}",
+        f"PO MJESECIMA: {_dumps(sorted(_group(months, 'month'), key=lambda m: m['name']))}",
+        f"PO PROVAJDERIMA: {_dumps(shown)}",
+    ]
+    if rest:
+        lines.append(f"OSTALI PROVAJDERI: {len(rest)} provajdera, ukupno €{sum(p['total'] for p in rest):.2f}")
+
+    if level['top_bills']:
+        top = sorted(bills, key=lambda b: b['amount'], reverse=True)[:level['top_bills']]
+        lines.append("NAJVEĆI RAČUNI: " + _dumps([
+            {'provider': b['beneficiary_name'], 'amount': b['amount'], 'date': str(b['reference_date'])} for b in top
+        ]))
+    if level['outliers']:
+        outliers = find_outliers(bills)[:level['outliers']]
+        if outliers:
+            lines.append(f"NEUOBIČAJENI RAČUNI: {_dumps(outliers)}")
+
+    return "\n".join(lines)
+
+
+def _build(instructions: str, closing: str, bills: List[Dict[str, Any]], budget: int) -> str:
+    prompt = ""
+    for level in DETAIL_LEVELS:
+        prompt = f"{instructions}\n{_data_section(bills, level)}\n\n{closing}"
+        if estimate_tokens(prompt) <= budget:
+            break
+    # The last level is only aggregates; it is sent even if it is still over the budget.
+    return prompt
+
+
+def build_monthly_prompt(bills: List[Dict[str, Any]], budget: int = None) -> str:
+    return _build(MONTHLY_INSTRUCTIONS, MONTHLY_CLOSING, bills, budget or settings.ANALYSIS_PROMPT_TOKEN_BUDGET)
+
+
+def build_category_prompt(bills: List[Dict[str, Any]], budget: int = None) -> str:
+    return _build(CATEGORY_INSTRUCTIONS, CATEGORY_CLOSING, bills, budget or settings.ANALYSIS_PROMPT_TOKEN_BUDGET)
+
+
+def build_prompt(analysis_type: str, bills: List[Dict[str, Any]], budget: int = None) -> str:
+    if analysis_type == 'monthly':
+        return build_monthly_prompt(bills, budget)
+    return build_category_prompt(bills, budget)
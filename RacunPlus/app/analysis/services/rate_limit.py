@@ -0,0 +1,131 @@
+import math
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Tuple
+
+from sqlalchemy import case, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from RacunPlus.settings import settings
+from RacunPlus.app.analysis.models.rate_limit import AnalysisRateLimit
+
+
+class Quota:
+    def __init__(self, limit: int, used: int, reset_at: float, allowed: bool = True):
+        self.limit = limit
+        self.remaining = max(0, limit - used)
+        self.reset_at = reset_at
+        self.allowed = allowed
+
+    def reset_seconds(self) -> int:
+        return max(0, math.ceil(self.reset_at - time.time()))
+
+    def headers(self) -> Dict[str, str]:
+        # X-RateLimit-Reset is in seconds until the window resets, like Retry-After.
+        return {
+            'X-RateLimit-Limit': str(self.limit),
+            'X-RateLimit-Remaining': str(self.remaining),
+            'X-RateLimit-Reset': str(self.reset_seconds()),
+        }
+
+
+def current_window() -> Tuple[date, float]:
+    # Today and the local midnight that ends it, as a time.time() timestamp.
+    today = date.today()
+    return today, datetime.combine(today + timedelta(days=1), datetime.min.time()).timestamp()
+
+
+# Daily fixed-window counters in this process; for single-worker deployments.
+class MemoryRateLimiter:
+    def __init__(self):
+        self._counts: Dict[str, Tuple[date, int]] = {}
+
+    def _used(self, user_id: str, today: date) -> int:
+        day, count = self._counts.get(str(user_id), (today, 0))
+        return count if day == today else 0
+
+    async def hit(self, db: AsyncSession, user_id: str) -> Quota:
+        # No await between the read and the write, so concurrent requests cannot both take the last slot.
+        today, reset_at = current_window()
+        limit = settings.ANALYSIS_RATE_LIMIT
+        used = self._used(user_id, today)
+        if used >= limit:
+            return Quota(limit, used, reset_at, allowed=False)
+        self._counts[str(user_id)] = (today, used + 1)
+        return Quota(limit, used + 1, reset_at)
+
+    async def peek(self, db: AsyncSession, user_id: str) -> Quota:
+        today, reset_at = current_window()
+        return Quota(settings.ANALYSIS_RATE_LIMIT, self._used(user_id, today), reset_at)
+
+    async def release(self, db: AsyncSession, user_id: str):
+        today, _ = current_window()
+        used = self._used(user_id, today)
+        if used > 0:
+            self._counts[str(user_id)] = (today, used - 1)
+
+    def clear(self):
+        self._counts.clear()
+
+
+# Daily fixed-window counters in analysis_rate_limits, shared by all worker processes.
+class DatabaseRateLimiter:
+    async def hit(self, db: AsyncSession, user_id: str) -> Quota:
+        today, reset_at = current_window()
+        limit = settings.ANALYSIS_RATE_LIMIT
+        if limit <= 0:
+            return Quota(limit, 0, reset_at, allowed=False)
+
+        # One upsert takes a slot or reports that none is left: the row lock makes
+        # concurrent requests queue up instead of all reading the same count.
+        stmt = pg_insert(AnalysisRateLimit).values(user_id=user_id, day=today, count=1)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[AnalysisRateLimit.user_id],
+            set_={
+                'day': stmt.excluded.day,
+                'count': case((AnalysisRateLimit.day == stmt.excluded.day, AnalysisRateLimit.count + 1), else_=1),
+            },
+            where=(AnalysisRateLimit.day != stmt.excluded.day) | (AnalysisRateLimit.count < limit),
+        ).returning(AnalysisRateLimit.count)
+        used = (await db.execute(stmt)).scalar_one_or_none()
+        # Commit right away; holding the row lock through the AI call would serialize the user's requests.
+        await db.commit()
+
+        if used is None:
+            return Quota(limit, limit, reset_at, allowed=False)
+        return Quota(limit, used, reset_at)
+
+    async def release(self, db: AsyncSession, user_id: str):
+        today, _ = current_window()
+        await db.execute(
+            update(AnalysisRateLimit)
+            .where(AnalysisRateLimit.user_id == user_id, AnalysisRateLimit.day == today, AnalysisRateLimit.count > 0)
+            .values(count=AnalysisRateLimit.count - 1)
+        )
+        await db.commit()
+
+    async def peek(self, db: AsyncSession, user_id: str) -> Quota:
+        today, reset_at = current_window()
+        used = await db.scalar(select(AnalysisRateLimit.count).where(
+            AnalysisRateLimit.user_id == user_id,
+            AnalysisRateLimit.day == today,
+        ))
+        return Quota(settings.ANALYSIS_RATE_LIMIT, used or 0, reset_at)
+
+
+_limiter = None
+
+
+def get_rate_limiter():
+    global _limiter
+    if _limiter is None:
+        if settings.ANALYSIS_RATE_LIMIT_BACKEND == 'memory':
+            _limiter = MemoryRateLimiter()
+        else:
+            _limiter = DatabaseRateLimiter()
+    return _limiter
+
+
+async def current_quota(db: AsyncSession, user_id: str) -> Quota:
+    return await get_rate_limiter().peek(db, user_id)
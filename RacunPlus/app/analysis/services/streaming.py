@@ -0,0 +1,101 @@
+import contextlib
+import json
+import logging
+import time
+from typing import Any, AsyncIterator, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from RacunPlus import metrics
+from RacunPlus.database import SessionLocal
+from RacunPlus.settings import settings
+from RacunPlus.app.analysis.models.analysis import Analysis
+from RacunPlus.app.analysis.database.analysis import create_analysis
+from RacunPlus.app.analysis.services.ai_service import AIResult, get_ai_service, parse_insights
+from RacunPlus.app.analysis.services.analysis import (
+    AnalysisInput,
+    analysis_to_response,
+    check_rate_limit,
+    find_cached_analysis,
+    load_analysis_input,
+    result_values,
+)
+from RacunPlus.app.analysis.services.prompt_builder import build_prompt
+from RacunPlus.app.analysis.services.rate_limit import Quota, current_quota
+
+logger = logging.getLogger(__name__)
+
+first_chunk_seconds = metrics.histogram('gemini_stream_first_chunk_seconds')
+
+
+def sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def open_analysis_stream(
+    db: AsyncSession,
+    user_id: str,
+    analysis_type: str,
+    days: int,
+) -> Tuple[AsyncIterator[str], Quota]:
+    # Input, cache and rate limit are checked before the response starts, so their errors are
+    # still plain HTTP errors. The iterator yields SSE events: `delta` per chunk of model text,
+    # `fallback` when the streamed text is replaced by the local engine answer, then `result`.
+    data = await load_analysis_input(db, user_id, analysis_type, days)
+
+    cached = await find_cached_analysis(db, user_id, data)
+    if cached:
+        return _cached_events(cached), await current_quota(db, user_id)
+
+    quota = await check_rate_limit(db, user_id)
+    return _stream_events(user_id, data), quota
+
+
+async def _cached_events(analysis: Analysis) -> AsyncIterator[str]:
+    yield sse('result', {'success': True, 'cached': True, 'data': analysis_to_response(analysis)})
+
+
+async def _stream_events(user_id: str, data: AnalysisInput) -> AsyncIterator[str]:
+    ai = get_ai_service()
+    prompt = build_prompt(data.analysis_type, data.bills)
+    chunks = []
+    tokens_used: Optional[int] = None
+    started = time.perf_counter()
+
+    try:
+        # aclosing gives the Gemini slot back right away when the client goes away mid-stream.
+        async with contextlib.aclosing(ai.stream(prompt)) as stream:
+            async for text, tokens in stream:
+                if started is not None:
+                    first_chunk_seconds.observe(time.perf_counter() - started)
+                    started = None
+                tokens_used = tokens or tokens_used
+                if text:
+                    chunks.append(text)
+                    yield sse('delta', {'text': text})
+        result = AIResult(
+            parse_insights(data.analysis_type, "".join(chunks), data.bills),
+            settings.GEMINI_MODEL,
+            prompt,
+            tokens_used,
+        )
+    except Exception:
+        logger.warning('analysis stream for user %s fell back to the local engine', user_id, exc_info=True)
+        result = ai.fallback(data.analysis_type, data.bills, prompt)
+        yield sse('fallback', {'reason': 'AI analiza nije uspjela, prikazana je osnovna analiza'})
+
+    # The request session is gone once the response starts streaming; store the result with our own.
+    async with SessionLocal() as db:
+        db.info['user_id'] = user_id
+        analysis = await create_analysis(db, Analysis(
+            user_id=user_id,
+            analysis_type=data.analysis_type,
+            period_start=data.start,
+            period_end=data.end,
+            total_amount=data.total_amount,
+            bills_count=len(data.bills),
+            status="completed",
+            **result_values(data, result),
+        ))
+
+    yield sse('result', {'success': True, 'cached': False, 'data': analysis_to_response(analysis)})
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Float, Date, ForeignKey, TIMESTAMP, func
+from sqlalchemy import Column, String, Float, Date, ForeignKey, Index, TIMESTAMP, func
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
 from RacunPlus.database import Base
@@ -11,4 +11,8 @@ class Bill(Base):
     beneficiary_name = Column(String, nullable=False)
     reference_date = Column(Date, nullable=False)
     status = Column(String, default="paid", nullable=False)
-    created_at = Column(TIMESTAMP(timezone=True), default=func.now(), nullable=False)
\ No newline at end of file
+    created_at = Column(TIMESTAMP(timezone=True), default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index('ix_bills_user_id_reference_date', user_id, reference_date, id),
+    )
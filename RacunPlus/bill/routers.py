@@ -1,13 +1,21 @@
+import base64
+import binascii
+import uuid
 from datetime import date
-from fastapi import APIRouter, Depends, HTTPException, status
-from pydantic import BaseModel
-from sqlalchemy.orm import Session
-from RacunPlus.database import SessionLocal
-from RacunPlus.user.routers import get_current_user
+from typing import Any, List, Optional
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, status
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import delete, func, insert, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from RacunPlus.dependencies import get_current_user, get_read_db, get_write_db
+from RacunPlus.app.analysis.services.data_aggregator import category_expression
 from .models import Bill
 
 router = APIRouter(prefix='/bills', tags=['bills'])
 
+MAX_PAGE_SIZE = 200
+MAX_BULK_SIZE = 1000
+
 
 class BillCreate(BaseModel):
     amount: float
@@ -16,61 +24,185 @@ class BillCreate(BaseModel):
     status: str = 'paid'
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+class BillUpdate(BaseModel):
+    amount: Optional[float] = None
+    beneficiary_name: Optional[str] = None
+    reference_date: Optional[date] = None
+    status: Optional[str] = None
+
 
+def bill_to_response(bill: Bill) -> dict:
+    return {
+        'id': str(bill.id),
+        'user_id': str(bill.user_id),
+        'amount': bill.amount,
+        'beneficiary_name': bill.beneficiary_name,
+        'reference_date': str(bill.reference_date),
+        'status': bill.status,
+        'created_at': str(bill.created_at)
+    }
+
+
+def encode_cursor(bill: Bill) -> str:
+    raw = f'{bill.reference_date.isoformat()}|{bill.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        ref_date, bill_id = raw.split('|', 1)
+        return date.fromisoformat(ref_date), uuid.UUID(bill_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail='Neispravan kursor')
 
 
 @router.post('/create', status_code=201)
-def create_bill(bill: BillCreate, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    new_bill = Bill(
-        user_id=current_user['id'],
-        amount=bill.amount,
-        beneficiary_name=bill.beneficiary_name,
-        reference_date=bill.reference_date,
-        status=bill.status
+async def create_bill(bill: BillCreate, current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_write_db)):
+    new_bill = await db.scalar(
+        insert(Bill).values(user_id=current_user['id'], **bill.model_dump()).returning(Bill)
     )
-    db.add(new_bill)
-    db.commit()
-    db.refresh(new_bill)
-    
+    await db.commit()
+
+    return bill_to_response(new_bill)
+
+
+@router.post('/bulk', status_code=201)
+async def create_bills_bulk(
+    bills: List[Any] = Body(..., min_length=1, max_length=MAX_BULK_SIZE),
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_write_db),
+):
+    rows = []
+    errors = []
+    for index, item in enumerate(bills):
+        try:
+            bill = BillCreate.model_validate(item)
+        except ValidationError as e:
+            errors.append({
+                'index': index,
+                'errors': [{'loc': err['loc'], 'msg': err['msg']} for err in e.errors()],
+            })
+            continue
+        rows.append({'user_id': current_user['id'], **bill.model_dump()})
+
+    if not rows:
+        raise HTTPException(status_code=422, detail=errors)
+
+    # One executemany; SQLAlchemy batches it into multi-row INSERT ... RETURNING.
+    created = (await db.scalars(insert(Bill).returning(Bill), rows)).all()
+    await db.commit()
+
     return {
-        'id': str(new_bill.id),
-        'user_id': str(new_bill.user_id),
-        'amount': new_bill.amount,
-        'beneficiary_name': new_bill.beneficiary_name,
-        'reference_date': str(new_bill.reference_date),
-        'status': new_bill.status,
-        'created_at': str(new_bill.created_at)
+        'created': [bill_to_response(b) for b in created],
+        'errors': errors,
     }
 
 
 @router.get('/list')
-def list_bills(current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    bills = db.query(Bill).filter(Bill.user_id == current_user['id']).all()
-    result = []
-    for b in bills:
-        result.append({
-            'id': str(b.id),
-            'user_id': str(b.user_id),
-            'amount': b.amount,
-            'beneficiary_name': b.beneficiary_name,
-            'reference_date': str(b.reference_date),
-            'status': b.status,
-            'created_at': str(b.created_at)
-        })
-    return result
+async def list_bills(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
+    status: Optional[str] = Query(None),
+    beneficiary_name: Optional[str] = Query(None),
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db),
+):
+    stmt = select(Bill).where(Bill.user_id == current_user['id'])
+
+    if date_from:
+        stmt = stmt.where(Bill.reference_date >= date_from)
+    if date_to:
+        stmt = stmt.where(Bill.reference_date <= date_to)
+    if status:
+        stmt = stmt.where(Bill.status == status)
+    if beneficiary_name:
+        stmt = stmt.where(Bill.beneficiary_name == beneficiary_name)
+
+    # Without limit/cursor the endpoint keeps returning the plain list for old clients.
+    if limit is None and cursor is None:
+        return [bill_to_response(b) for b in (await db.scalars(stmt)).all()]
+
+    if cursor:
+        cursor_date, cursor_id = decode_cursor(cursor)
+        stmt = stmt.where(tuple_(Bill.reference_date, Bill.id) < (cursor_date, cursor_id))
+
+    page_size = limit or MAX_PAGE_SIZE
+    stmt = stmt.order_by(Bill.reference_date.desc(), Bill.id.desc()).limit(page_size + 1)
+    bills = (await db.scalars(stmt)).all()
+
+    has_more = len(bills) > page_size
+    bills = bills[:page_size]
+
+    return {
+        'items': [bill_to_response(b) for b in bills],
+        'next_cursor': encode_cursor(bills[-1]) if has_more else None,
+    }
+
+
+@router.get('/summary')
+async def bills_summary(
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db),
+):
+    bills = select(
+        func.to_char(Bill.reference_date, 'YYYY-MM').label('month'),
+        Bill.beneficiary_name.label('beneficiary'),
+        category_expression(Bill.beneficiary_name).label('category'),
+        Bill.amount,
+    ).where(Bill.user_id == current_user['id'])
+    if date_from:
+        bills = bills.where(Bill.reference_date >= date_from)
+    if date_to:
+        bills = bills.where(Bill.reference_date <= date_to)
+    bills = bills.subquery()
+
+    # One GROUP BY over grouping sets returns the per-month, per-beneficiary,
+    # per-category and overall rows together; grouping() tells them apart.
+    stmt = select(
+        bills.c.month,
+        bills.c.beneficiary,
+        bills.c.category,
+        func.grouping(bills.c.month, bills.c.beneficiary, bills.c.category).label('grouping'),
+        func.sum(bills.c.amount).label('total'),
+        func.count().label('count'),
+    ).group_by(func.grouping_sets(
+        tuple_(bills.c.month),
+        tuple_(bills.c.beneficiary),
+        tuple_(bills.c.category),
+        tuple_(),
+    ))
+
+    summary = {'total': 0, 'count': 0, 'by_month': [], 'by_beneficiary': [], 'by_category': []}
+    groups = {0b011: ('by_month', 'month'), 0b101: ('by_beneficiary', 'beneficiary'), 0b110: ('by_category', 'category')}
+    for row in (await db.execute(stmt)).all():
+        if row.grouping == 0b111:
+            summary['total'] = round(row.total or 0, 2)
+            summary['count'] = row.count
+            continue
+        key, column = groups[row.grouping]
+        summary[key].append({column: getattr(row, column), 'total': round(row.total, 2), 'count': row.count})
+
+    summary['by_month'].sort(key=lambda x: x['month'])
+    summary['by_beneficiary'].sort(key=lambda x: x['total'], reverse=True)
+    summary['by_category'].sort(key=lambda x: x['total'], reverse=True)
+
+    return {
+        'date_from': str(date_from) if date_from else None,
+        'date_to': str(date_to) if date_to else None,
+        **summary,
+    }
 
 
 @router.get('/{bill_id}')
-def get_bill(bill_id: str, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    bill = db.query(Bill).filter(
+async def get_bill(bill_id: str, current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_read_db)):
+    bill = await db.scalar(select(Bill).where(
         (Bill.id == bill_id) & (Bill.user_id == current_user['id'])
-    ).first()
+    ))
     
     if not bill:
         raise HTTPException(status_code=404, detail='Račun nije pronađen')
@@ -86,45 +218,47 @@ def get_bill(bill_id: str, current_user: dict = Depends(get_current_user), db: S
     }
 
 
-@router.put('/{bill_id}')
-def update_bill(bill_id: str, bill: BillCreate, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    existing_bill = db.query(Bill).filter(
-        (Bill.id == bill_id) & (Bill.user_id == current_user['id'])
-    ).first()
-    
-    if not existing_bill:
+async def update_bill_columns(db: AsyncSession, bill_id: str, user_id: str, values: dict) -> dict:
+    # One UPDATE ... RETURNING; a missing or foreign bill simply matches no row.
+    bill = await db.scalar(
+        update(Bill)
+        .where((Bill.id == bill_id) & (Bill.user_id == user_id))
+        .values(**values)
+        .returning(Bill)
+    )
+
+    if not bill:
         raise HTTPException(status_code=404, detail='Račun nije pronađen')
-    
-    existing_bill.amount = bill.amount
-    existing_bill.beneficiary_name = bill.beneficiary_name
-    existing_bill.reference_date = bill.reference_date
-    existing_bill.status = bill.status
-    
-    db.commit()
-    db.refresh(existing_bill)
-    
-    return {
-        'id': str(existing_bill.id),
-        'user_id': str(existing_bill.user_id),
-        'amount': existing_bill.amount,
-        'beneficiary_name': existing_bill.beneficiary_name,
-        'reference_date': str(existing_bill.reference_date),
-        'status': existing_bill.status,
-        'created_at': str(existing_bill.created_at)
-    }
+
+    await db.commit()
+    return bill_to_response(bill)
+
+
+@router.put('/{bill_id}')
+async def update_bill(bill_id: str, bill: BillCreate, current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_write_db)):
+    return await update_bill_columns(db, bill_id, current_user['id'], bill.model_dump())
+
+
+@router.patch('/{bill_id}')
+async def patch_bill(bill_id: str, bill: BillUpdate, current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_write_db)):
+    values = bill.model_dump(exclude_unset=True, exclude_none=True)
+    if not values:
+        raise HTTPException(status_code=400, detail='Nema polja za izmjenu')
+
+    return await update_bill_columns(db, bill_id, current_user['id'], values)
 
 
 @router.delete('/{bill_id}')
-def delete_bill(bill_id: str, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    bill = db.query(Bill).filter(
-        (Bill.id == bill_id) & (Bill.user_id == current_user['id'])
-    ).first()
-    
-    if not bill:
+async def delete_bill(bill_id: str, current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_write_db)):
+    deleted_id = await db.scalar(
+        delete(Bill)
+        .where((Bill.id == bill_id) & (Bill.user_id == current_user['id']))
+        .returning(Bill.id)
+    )
+
+    if not deleted_id:
         raise HTTPException(status_code=404, detail='Račun nije pronađen')
-    
-    db.delete(bill)
-    db.commit()
-    
-    return {'message': 'Račun je obrisan'}
 
+    await db.commit()
+
+    return {'message': 'Račun je obrisan'}
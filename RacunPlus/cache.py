@@ -0,0 +1,47 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from RacunPlus import metrics
+
+
+# Bounded per-process LRU; every entry carries its own expiry as a time.time() timestamp.
+class TTLCache:
+    def __init__(self, name: str, maxsize: int):
+        self._maxsize = maxsize
+        self._entries: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = metrics.counter(f'{name}_hits_total')
+        self.misses = metrics.counter(f'{name}_misses_total')
+        metrics.gauge(f'{name}_size', lambda: len(self._entries))
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= time.time():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses.inc()
+                return None
+            self._entries.move_to_end(key)
+        self.hits.inc()
+        return entry[0]
+
+    def set(self, key: Hashable, value: Any, expires_at: float):
+        if self._maxsize <= 0 or expires_at <= time.time():
+            return
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
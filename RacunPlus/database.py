@@ -1,11 +1,123 @@
-from sqlalchemy import create_engine
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.ext.declarative import declarative_base
+import asyncio
+import random
+import time
+from typing import Dict
+from sqlalchemy import event, exc, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from . import metrics
 from .settings import settings
 
 
-engine = create_engine(settings.DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+pool_wait_seconds = metrics.histogram('db_pool_wait_seconds')
+pool_timeouts = metrics.counter('db_pool_timeouts_total')
+replica_reads = metrics.counter('db_reads_replica_total')
+primary_reads = metrics.counter('db_reads_primary_total')
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            pool_timeouts.inc()
+            raise
+        finally:
+            pool_wait_seconds.observe(time.perf_counter() - started)
+
+
+def async_database_url(url: str) -> str:
+    # DATABASE_URL stays a sync URL for Alembic; the app uses the same database through asyncpg.
+    return make_url(url).set(drivername='postgresql+asyncpg').render_as_string(hide_password=False)
+
+
+def make_engine(url: str):
+    return create_async_engine(
+        async_database_url(url),
+        poolclass=InstrumentedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+    )
+
+
+def make_sessionmaker(bind):
+    return async_sessionmaker(bind=bind, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+
+engine = make_engine(settings.DATABASE_URL)
+SessionLocal = make_sessionmaker(engine)
 Base = declarative_base()
 
+read_engines = [make_engine(url.strip()) for url in (settings.DATABASE_READ_URL or '').split(',') if url.strip()]
+read_session_factories = [make_sessionmaker(e) for e in read_engines]
+
+metrics.gauge('db_pool_size', lambda: engine.pool.size())
+metrics.gauge('db_pool_checked_out', lambda: engine.pool.checkedout())
+metrics.gauge('db_pool_checked_in', lambda: engine.pool.checkedin())
+metrics.gauge('db_pool_overflow', lambda: engine.pool.overflow())
+
+
+_recent_writes: Dict[str, float] = {}
+
+
+def mark_recent_write(user_id: str):
+    now = time.monotonic()
+    _recent_writes[str(user_id)] = now
+    if len(_recent_writes) > 10000:
+        cutoff = now - settings.READ_YOUR_WRITES_SECONDS
+        for key, written_at in list(_recent_writes.items()):
+            if written_at < cutoff:
+                _recent_writes.pop(key, None)
+
+
+def has_recent_write(user_id: str) -> bool:
+    written_at = _recent_writes.get(str(user_id))
+    return written_at is not None and time.monotonic() - written_at < settings.READ_YOUR_WRITES_SECONDS
+
+
+@event.listens_for(Session, 'after_commit')
+def remember_user_write(session):
+    user_id = session.info.get('user_id')
+    if user_id:
+        mark_recent_write(user_id)
+
+
+def read_session_factory(user_id: str):
+    # Replicas lag the primary, so a user who just wrote keeps reading from the primary for a while.
+    if read_session_factories and not has_recent_write(user_id):
+        replica_reads.inc()
+        return random.choice(read_session_factories)
+    primary_reads.inc()
+    return SessionLocal
+
+
+async def get_db():
+    async with SessionLocal() as db:
+        yield db
+
+
+async def dispose_engines():
+    for e in [engine, *read_engines]:
+        await e.dispose()
+
+
+async def warm_up_engine(target, size: int):
+    async def open_connection():
+        conn = await target.connect()
+        await conn.execute(text('SELECT 1'))
+        return conn
+
+    connections = await asyncio.gather(*(open_connection() for _ in range(size)))
+    for conn in connections:
+        await conn.close()
+
+
+async def warm_up_pool(size: int = settings.DB_POOL_SIZE):
+    for e in [engine, *read_engines]:
+        await warm_up_engine(e, size)
@@ -0,0 +1,45 @@
+import hashlib
+from fastapi import Depends, HTTPException
+from fastapi.security import OAuth2PasswordBearer
+from jose import jwt, JWTError
+from RacunPlus.cache import TTLCache
+from RacunPlus.database import SessionLocal, read_session_factory
+from RacunPlus.settings import settings
+
+
+oauth2 = OAuth2PasswordBearer(tokenUrl='auth/login')
+# Decoded claims of already verified tokens, kept until the token's own exp.
+token_cache = TTLCache('token_cache', settings.TOKEN_CACHE_SIZE)
+
+
+async def get_current_user(token: str = Depends(oauth2)):
+    key = hashlib.sha256(token.encode()).digest()
+    current_user = token_cache.get(key)
+    if current_user is not None:
+        return current_user
+
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        username = payload.get('sub')
+        user_id = payload.get('id')
+        if not username or not user_id:
+            raise HTTPException(status_code=401, detail='Greska sa tokenom')
+    except JWTError:
+        raise HTTPException(status_code=401, detail='Greska sa tokenom')
+
+    current_user = {'username': username, 'id': user_id}
+    if payload.get('exp'):
+        token_cache.set(key, current_user, payload['exp'])
+    return current_user
+
+
+async def get_read_db(current_user: dict = Depends(get_current_user)):
+    async with read_session_factory(current_user['id'])() as db:
+        yield db
+
+
+async def get_write_db(current_user: dict = Depends(get_current_user)):
+    async with SessionLocal() as db:
+        # Commits on this session mark the user as a recent writer (read-your-writes).
+        db.info['user_id'] = current_user['id']
+        yield db
@@ -1,12 +1,37 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from RacunPlus.database import dispose_engines, warm_up_pool
+from RacunPlus.settings import settings
+from RacunPlus.user.passwords import shutdown_pool, start_pool
+from RacunPlus.app.analysis.services.ai_service import close_ai_service, start_ai_service
+from RacunPlus.app.analysis.services.jobs import start_workers, stop_workers
+from RacunPlus.metrics import router as metrics_router
 from RacunPlus.user.routers import router as user_router
 from RacunPlus.bill.routers import router as bill_router
 from RacunPlus.transaction.routers import router as transaction_router
+from RacunPlus.rollup.routers import router as rollup_router
 from RacunPlus.app.analysis.api.analysis import router as analysis_router
 
-app = FastAPI(title="RacunPlus")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.DB_POOL_WARMUP:
+        await warm_up_pool()
+    start_pool()
+    start_ai_service()
+    start_workers()
+    yield
+    await stop_workers()
+    await close_ai_service()
+    shutdown_pool()
+    await dispose_engines()
+
+
+app = FastAPI(title="RacunPlus", lifespan=lifespan)
 
 app.include_router(user_router)
 app.include_router(bill_router)
 app.include_router(transaction_router)
-app.include_router(analysis_router)
\ No newline at end of file
+app.include_router(rollup_router)
+app.include_router(analysis_router)
+app.include_router(metrics_router)
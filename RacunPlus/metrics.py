@@ -0,0 +1,95 @@
+import bisect
+import threading
+from typing import Callable, Dict, Sequence
+
+from fastapi import APIRouter
+
+router = APIRouter(tags=['metrics'])
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Counter:
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1):
+        with self._lock:
+            self._value += amount
+
+    def snapshot(self):
+        return self._value
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self._buckets = tuple(buckets)
+        self._counts = [0] * (len(self._buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        buckets = {}
+        cumulative = 0
+        for bound, bucket_count in zip(self._buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            buckets['+Inf' if bound == float('inf') else str(bound)] = cumulative
+        return {'count': count, 'sum': round(total, 6), 'buckets': buckets}
+
+
+class Gauge:
+    # Read on demand, so values like queue sizes are never stale.
+    def __init__(self, read: Callable[[], float]):
+        self._read = read
+
+    def snapshot(self):
+        return self._read()
+
+
+_registry: Dict[str, object] = {}
+_registry_lock = threading.Lock()
+
+
+def _get_or_create(name: str, factory):
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = factory()
+        return metric
+
+
+def counter(name: str) -> Counter:
+    return _get_or_create(name, Counter)
+
+
+def histogram(name: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return _get_or_create(name, lambda: Histogram(buckets))
+
+
+def gauge(name: str, read: Callable[[], float]) -> Gauge:
+    with _registry_lock:
+        metric = _registry[name] = Gauge(read)
+        return metric
+
+
+def snapshot() -> dict:
+    with _registry_lock:
+        metrics = dict(_registry)
+    return {name: metric.snapshot() for name, metric in sorted(metrics.items())}
+
+
+@router.get('/metrics')
+async def get_metrics():
+    return snapshot()
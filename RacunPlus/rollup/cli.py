@@ -0,0 +1,39 @@
+import argparse
+import asyncio
+import sys
+from typing import List, Optional
+
+from RacunPlus.database import SessionLocal, engine
+from .service import backfill_rollup, check_category_drift, check_rollup
+
+
+async def run(command: str, user_id: Optional[str]) -> int:
+    try:
+        async with SessionLocal() as db:
+            if command == 'backfill':
+                print(f'rebuilt {await backfill_rollup(db, user_id)} rollup rows')
+                return 0
+
+            mismatches = await check_rollup(db, user_id)
+            for m in mismatches:
+                print(m)
+            drift = await check_category_drift(db)
+            for name in drift:
+                print(f'category drift: {name!r} is categorized differently by rollup_category() and CATEGORY_MAP')
+            print(f'{len(mismatches)} mismatched rollup rows, {len(drift)} drifted names')
+            return 1 if mismatches or drift else 0
+    finally:
+        await engine.dispose()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Maintain the user_monthly_rollup table')
+    parser.add_argument('command', choices=['backfill', 'check'])
+    parser.add_argument('--user-id')
+    args = parser.parse_args(argv)
+
+    sys.exit(asyncio.run(run(args.command, args.user_id)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,16 @@
+from sqlalchemy import Column, String, Float, Integer, Date, ForeignKey
+from sqlalchemy.dialects.postgresql import UUID
+from RacunPlus.database import Base
+
+
+class UserMonthlyRollup(Base):
+    # Maintained by the rollup_bills / rollup_transaction triggers, never written by the app.
+    __tablename__ = 'user_monthly_rollup'
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), primary_key=True)
+    source = Column(String, primary_key=True)
+    month = Column(Date, primary_key=True)
+    category = Column(String, primary_key=True)
+    total_amount = Column(Float, nullable=False)
+    item_count = Column(Integer, nullable=False)
+    min_amount = Column(Float, nullable=True)
+    max_amount = Column(Float, nullable=True)
@@ -0,0 +1,31 @@
+from datetime import date
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from RacunPlus.dependencies import get_current_user, get_read_db
+from .service import get_monthly_rollup
+
+router = APIRouter(prefix='/rollup', tags=['rollup'])
+
+
+@router.get('/monthly')
+async def monthly_rollup(
+    source: Optional[Literal['bill', 'transaction']] = Query(None),
+    month_from: Optional[date] = Query(None),
+    month_to: Optional[date] = Query(None),
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db),
+):
+    rows = await get_monthly_rollup(db, current_user['id'], source, month_from, month_to)
+    return [
+        {
+            'source': r.source,
+            'month': r.month.strftime('%Y-%m'),
+            'category': r.category,
+            'total_amount': round(r.total_amount, 2),
+            'count': r.item_count,
+            'min_amount': r.min_amount,
+            'max_amount': r.max_amount,
+        }
+        for r in rows
+    ]
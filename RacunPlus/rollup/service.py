@@ -0,0 +1,135 @@
+from datetime import date
+from typing import List, Optional
+
+from sqlalchemy import Date, and_, cast, delete, func, insert, literal, or_, select, text, union, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from RacunPlus.bill.models import Bill
+from RacunPlus.transaction.models import Transaction
+from RacunPlus.app.analysis.services.data_aggregator import category_expression
+from .models import UserMonthlyRollup
+
+
+SOURCES = {
+    'bill': (Bill, Bill.reference_date, Bill.beneficiary_name),
+    'transaction': (Transaction, Transaction.transaction_date, Transaction.merchant_name),
+}
+
+AMOUNT_TOLERANCE = 0.005
+
+
+def fresh_rollup(source: str, user_id: Optional[str] = None):
+    model, date_column, name_column = SOURCES[source]
+    rows = select(
+        model.user_id,
+        cast(func.date_trunc('month', date_column), Date).label('month'),
+        func.rollup_category(name_column).label('category'),
+        model.amount,
+    )
+    if user_id:
+        rows = rows.where(model.user_id == user_id)
+    rows = rows.subquery()
+
+    return select(
+        rows.c.user_id,
+        literal(source).label('source'),
+        rows.c.month,
+        rows.c.category,
+        func.sum(rows.c.amount).label('total_amount'),
+        func.count().label('item_count'),
+        func.min(rows.c.amount).label('min_amount'),
+        func.max(rows.c.amount).label('max_amount'),
+    ).group_by(rows.c.user_id, rows.c.month, rows.c.category)
+
+
+async def backfill_rollup(db: AsyncSession, user_id: Optional[str] = None) -> int:
+    # Blocks concurrent writers (their triggers need ROW EXCLUSIVE) while the rows are rebuilt.
+    await db.execute(text('LOCK TABLE user_monthly_rollup IN SHARE ROW EXCLUSIVE MODE'))
+
+    stmt = delete(UserMonthlyRollup)
+    if user_id:
+        stmt = stmt.where(UserMonthlyRollup.user_id == user_id)
+    await db.execute(stmt)
+
+    columns = ['user_id', 'source', 'month', 'category', 'total_amount', 'item_count', 'min_amount', 'max_amount']
+    inserted = 0
+    for source in SOURCES:
+        result = await db.execute(insert(UserMonthlyRollup).from_select(columns, fresh_rollup(source, user_id)))
+        inserted += result.rowcount
+
+    await db.commit()
+    return inserted
+
+
+async def check_rollup(db: AsyncSession, user_id: Optional[str] = None) -> List[dict]:
+    fresh = union_all(*(fresh_rollup(source, user_id) for source in SOURCES)).subquery()
+    stored = select(UserMonthlyRollup)
+    if user_id:
+        stored = stored.where(UserMonthlyRollup.user_id == user_id)
+    stored = stored.subquery()
+
+    stmt = select(
+        func.coalesce(stored.c.user_id, fresh.c.user_id).label('user_id'),
+        func.coalesce(stored.c.source, fresh.c.source).label('source'),
+        func.coalesce(stored.c.month, fresh.c.month).label('month'),
+        func.coalesce(stored.c.category, fresh.c.category).label('category'),
+        stored.c.total_amount.label('stored_total'),
+        fresh.c.total_amount.label('expected_total'),
+        stored.c.item_count.label('stored_count'),
+        fresh.c.item_count.label('expected_count'),
+    ).select_from(
+        stored.outerjoin(fresh, and_(
+            stored.c.user_id == fresh.c.user_id,
+            stored.c.source == fresh.c.source,
+            stored.c.month == fresh.c.month,
+            stored.c.category == fresh.c.category,
+        ), full=True)
+    ).where(or_(
+        stored.c.user_id.is_(None),
+        fresh.c.user_id.is_(None),
+        stored.c.item_count != fresh.c.item_count,
+        func.abs(stored.c.total_amount - fresh.c.total_amount) > AMOUNT_TOLERANCE,
+        stored.c.min_amount != fresh.c.min_amount,
+        stored.c.max_amount != fresh.c.max_amount,
+    ))
+
+    mismatches = []
+    for row in (await db.execute(stmt)).all():
+        mismatches.append({
+            'user_id': str(row.user_id),
+            'source': row.source,
+            'month': str(row.month),
+            'category': row.category,
+            'stored_total': row.stored_total,
+            'expected_total': row.expected_total,
+            'stored_count': row.stored_count,
+            'expected_count': row.expected_count,
+        })
+    return mismatches
+
+
+async def check_category_drift(db: AsyncSession) -> List[str]:
+    # rollup_category() is frozen in a migration; report names it now maps differently than CATEGORY_MAP.
+    names = union(*(select(name_column.label('name')) for _, _, name_column in SOURCES.values())).subquery()
+    stmt = select(names.c.name).where(
+        func.rollup_category(names.c.name) != category_expression(names.c.name)
+    )
+    return list((await db.scalars(stmt)).all())
+
+
+async def get_monthly_rollup(
+    db: AsyncSession,
+    user_id: str,
+    source: Optional[str] = None,
+    month_from: Optional[date] = None,
+    month_to: Optional[date] = None,
+) -> List[UserMonthlyRollup]:
+    stmt = select(UserMonthlyRollup).where(UserMonthlyRollup.user_id == user_id)
+    if source:
+        stmt = stmt.where(UserMonthlyRollup.source == source)
+    if month_from:
+        stmt = stmt.where(UserMonthlyRollup.month >= month_from.replace(day=1))
+    if month_to:
+        stmt = stmt.where(UserMonthlyRollup.month <= month_to)
+    stmt = stmt.order_by(UserMonthlyRollup.month, UserMonthlyRollup.source, UserMonthlyRollup.category)
+    return list((await db.scalars(stmt)).all())
@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pathlib import Path
+from typing import Literal, Optional
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -7,12 +8,38 @@ class Settings(BaseSettings):
     model_config = SettingsConfigDict(env_file=BASE_DIR / '.env', extra='ignore')
 
     DATABASE_URL: str
+    DATABASE_READ_URL: Optional[str] = None
+    READ_YOUR_WRITES_SECONDS: float = 5.0
     SECRET_KEY: str
     GEMINI_API_KEY: str
     GEMINI_MODEL: str = "gemini-2.0-flash-exp"
+    GEMINI_TIMEOUT_SECONDS: float = 20
+    GEMINI_STREAM_TIMEOUT_SECONDS: float = 120
+    GEMINI_MAX_CONCURRENCY: int = 4
+    GEMINI_BREAKER_FAILURES: int = 5
+    GEMINI_BREAKER_SECONDS: float = 30
+    ANALYSIS_PROMPT_TOKEN_BUDGET: int = 2000
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60
+    REFRESH_TOKEN_EXPIRE_DAYS: int = 30
+    TOKEN_CACHE_SIZE: int = 10000
+    PROFILE_CACHE_SIZE: int = 10000
+    PROFILE_CACHE_SECONDS: int = 60
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_QUEUE: int = 100
     ANALYSIS_RATE_LIMIT: int = 10
+    # 'memory' is only correct with a single worker process.
+    ANALYSIS_RATE_LIMIT_BACKEND: Literal['database', 'memory'] = 'database'
+    ANALYSIS_WORKERS: int = 2
+    ANALYSIS_QUEUE_SIZE: int = 100
+    ANALYSIS_MAX_WAIT_SECONDS: float = 30
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_WARMUP: bool = True
 
 settings = Settings()
 
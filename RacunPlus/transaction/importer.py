@@ -0,0 +1,215 @@
+import argparse
+import asyncio
+import csv
+import io
+import itertools
+import math
+import sys
+from datetime import date, datetime
+from typing import AsyncIterator, Dict, Iterator, List, Optional, TextIO
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from RacunPlus.database import SessionLocal, engine
+
+
+COLUMN_ALIASES = {
+    'transaction_date': ('transaction_date', 'date', 'datum', 'booking_date'),
+    'merchant_name': ('merchant_name', 'merchant', 'description', 'opis', 'primalac'),
+    'amount': ('amount', 'iznos'),
+    'status': ('status',),
+}
+DATE_FORMATS = ('%Y-%m-%d', '%d.%m.%Y', '%d/%m/%Y')
+DEFAULT_STATUS = 'completed'
+MAX_REPORTED_ERRORS = 50
+COPY_CHUNK_ROWS = 1000
+
+CREATE_STAGING_SQL = """
+CREATE TEMP TABLE transaction_import (
+    amount double precision NOT NULL,
+    merchant_name text NOT NULL,
+    transaction_date date NOT NULL,
+    status text NOT NULL
+) ON COMMIT DROP
+"""
+
+# Identical lines in one statement are separate purchases: the n-th repeat of a
+# (date, amount, merchant) line is only skipped when n such transactions already exist.
+MERGE_SQL = """
+INSERT INTO "transaction" (id, user_id, amount, merchant_name, transaction_date, status)
+SELECT gen_random_uuid(), CAST(:user_id AS uuid), s.amount, s.merchant_name, s.transaction_date, s.status
+FROM (
+    SELECT amount, merchant_name, transaction_date, status,
+           row_number() OVER (PARTITION BY transaction_date, amount, merchant_name) AS occurrence
+    FROM transaction_import
+) s
+WHERE s.occurrence > (
+    SELECT count(*) FROM "transaction" t
+    WHERE t.user_id = CAST(:user_id AS uuid)
+      AND t.transaction_date = s.transaction_date
+      AND t.amount = s.amount
+      AND t.merchant_name = s.merchant_name
+)
+"""
+
+
+class ImportReport:
+    def __init__(self):
+        self.parsed = 0
+        self.inserted = 0
+        self.invalid = 0
+        self.errors: List[dict] = []
+
+    def add_error(self, line: int, message: str):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+    def to_dict(self) -> dict:
+        return {
+            'parsed': self.parsed,
+            'inserted': self.inserted,
+            'duplicates': self.parsed - self.inserted,
+            'invalid': self.invalid,
+            'errors': self.errors,
+        }
+
+
+def parse_amount(value: str) -> float:
+    value = value.strip().replace(' ', '').replace('€', '')
+    if ',' in value and '.' in value:
+        if value.rfind(',') > value.rfind('.'):
+            value = value.replace('.', '').replace(',', '.')
+        else:
+            value = value.replace(',', '')
+    elif ',' in value:
+        value = value.replace(',', '.')
+    amount = float(value)
+    # float() also takes nan and inf, which JSON responses and the rollup sums cannot hold.
+    if not math.isfinite(amount):
+        raise ValueError(f'Neispravan iznos: {value}')
+    return amount
+
+
+def parse_date(value: str) -> date:
+    value = value.strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f'Nepoznat format datuma: {value}')
+
+
+def resolve_columns(header: List[str]) -> Dict[str, str]:
+    normalized = {h.strip().lower(): h for h in header}
+    columns = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in normalized:
+                columns[field] = normalized[alias]
+                break
+    missing = [f for f in ('transaction_date', 'merchant_name', 'amount') if f not in columns]
+    if missing:
+        raise ValueError(f'Nedostaju kolone: {", ".join(missing)}')
+    return columns
+
+
+def iter_rows(reader: csv.DictReader, report: ImportReport) -> Iterator[dict]:
+    # A line the csv module cannot parse (e.g. a field over csv.field_size_limit()) is one invalid line.
+    while True:
+        try:
+            yield next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            report.add_error(reader.line_num, str(e))
+
+
+def iter_copy_lines(reader: csv.DictReader, columns: Dict[str, str], report: ImportReport) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    for row in iter_rows(reader, report):
+        try:
+            merchant = (row[columns['merchant_name']] or '').strip()
+            if not merchant:
+                raise ValueError('Prazan naziv trgovca')
+            status = (row.get(columns.get('status', ''), '') or '').strip() or DEFAULT_STATUS
+            # Postgres text cannot hold NUL, so COPY would fail the whole import.
+            if '\x00' in merchant or '\x00' in status:
+                raise ValueError('Red sadrži NUL znak')
+            writer.writerow([
+                parse_amount(row[columns['amount']] or ''),
+                merchant,
+                parse_date(row[columns['transaction_date']] or '').isoformat(),
+                status,
+            ])
+        except (ValueError, KeyError, AttributeError) as e:
+            report.add_error(reader.line_num, str(e))
+            continue
+
+        report.parsed += 1
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def read_copy_chunk(lines: Iterator[str]) -> bytes:
+    return ''.join(itertools.islice(lines, COPY_CHUNK_ROWS)).encode()
+
+
+async def iter_copy_chunks(lines: Iterator[str]) -> AsyncIterator[bytes]:
+    # CSV parsing is CPU work on a blocking file, so each chunk is read off the event loop.
+    while True:
+        chunk = await asyncio.to_thread(read_copy_chunk, lines)
+        if not chunk:
+            break
+        yield chunk
+
+
+async def import_transactions_csv(db: AsyncSession, user_id: str, stream: TextIO) -> dict:
+    report = ImportReport()
+    reader = csv.DictReader(stream)
+    columns = resolve_columns(reader.fieldnames or [])
+
+    await db.execute(text(CREATE_STAGING_SQL))
+    connection = await (await db.connection()).get_raw_connection()
+    await connection.driver_connection.copy_to_table(
+        'transaction_import',
+        source=iter_copy_chunks(iter_copy_lines(reader, columns, report)),
+        columns=['amount', 'merchant_name', 'transaction_date', 'status'],
+        format='csv',
+    )
+
+    result = await db.execute(text(MERGE_SQL), {'user_id': user_id})
+    report.inserted = result.rowcount
+    await db.commit()
+
+    return report.to_dict()
+
+
+async def run_import(user_id: str, path: str, encoding: str) -> dict:
+    try:
+        async with SessionLocal() as db:
+            if path == '-':
+                return await import_transactions_csv(db, user_id, sys.stdin)
+            with open(path, encoding=encoding, newline='') as f:
+                return await import_transactions_csv(db, user_id, f)
+    finally:
+        await engine.dispose()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Import bank statement CSV into transactions')
+    parser.add_argument('--user-id', required=True)
+    parser.add_argument('path', help='CSV file, or - for stdin')
+    parser.add_argument('--encoding', default='utf-8-sig')
+    args = parser.parse_args(argv)
+
+    print(asyncio.run(run_import(args.user_id, args.path, args.encoding)))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Float, Date, ForeignKey
+from sqlalchemy import Column, String, Float, Date, ForeignKey, Index
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
 from RacunPlus.database import Base
@@ -12,3 +12,6 @@ class Transaction(Base):
     transaction_date = Column(Date, nullable=False)
     status = Column(String, default="Not_completed")
 
+    __table_args__ = (
+        Index('ix_transaction_user_id_transaction_date', user_id, transaction_date),
+    )
@@ -1,13 +1,24 @@
+import csv
+import io
+import json
 from datetime import date
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile, status
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
-from RacunPlus.database import SessionLocal
-from RacunPlus.user.routers import get_current_user
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from RacunPlus.database import read_session_factory
+from RacunPlus.dependencies import get_current_user, get_read_db, get_write_db
 from .models import Transaction
+from .importer import import_transactions_csv
 
 router = APIRouter(prefix='/transactions', tags=['transactions'])
 
+EXPORT_BATCH_SIZE = 1000
+EXPORT_FIELDS = ['id', 'user_id', 'amount', 'merchant_name', 'transaction_date', 'status']
+EXPORT_MEDIA_TYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
 
 class TransactionCreate(BaseModel):
     amount: float
@@ -16,42 +27,93 @@ class TransactionCreate(BaseModel):
     status: str = 'completed'
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+class TransactionUpdate(BaseModel):
+    amount: Optional[float] = None
+    merchant_name: Optional[str] = None
+    transaction_date: Optional[date] = None
+    status: Optional[str] = None
 
 
+def transaction_to_response(transaction: Transaction) -> dict:
+    return {
+        'id': str(transaction.id),
+        'user_id': str(transaction.user_id),
+        'amount': transaction.amount,
+        'merchant_name': transaction.merchant_name,
+        'transaction_date': str(transaction.transaction_date),
+        'status': transaction.status
+    }
 
-@router.post('/create', status_code=201)
-def create_transaction(transaction: TransactionCreate, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    new_transaction = Transaction(
-        user_id=current_user['id'],
-        amount=transaction.amount,
-        merchant_name=transaction.merchant_name,
-        transaction_date=transaction.transaction_date,
-        status=transaction.status
-    )
-    
-    db.add(new_transaction)
-    db.commit()
-    db.refresh(new_transaction)
-    
+
+def export_row(row) -> dict:
     return {
-        'id': str(new_transaction.id),
-        'user_id': str(new_transaction.user_id),
-        'amount': new_transaction.amount,
-        'merchant_name': new_transaction.merchant_name,
-        'transaction_date': str(new_transaction.transaction_date),
-        'status': new_transaction.status
+        'id': str(row.id),
+        'user_id': str(row.user_id),
+        'amount': row.amount,
+        'merchant_name': row.merchant_name,
+        'transaction_date': str(row.transaction_date),
+        'status': row.status
     }
 
 
+async def stream_transactions(user_id: str, format: str):
+    # Own session: the request-scoped one may be closed before the body is fully sent.
+    async with read_session_factory(user_id)() as db:
+        stmt = select(
+            Transaction.id,
+            Transaction.user_id,
+            Transaction.amount,
+            Transaction.merchant_name,
+            Transaction.transaction_date,
+            Transaction.status,
+        ).where(
+            Transaction.user_id == user_id
+        ).order_by(Transaction.transaction_date).execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+        if format == 'csv':
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+            writer.writeheader()
+            yield buffer.getvalue()
+
+        result = await db.stream(stmt)
+        async for batch in result.partitions():
+            if format == 'csv':
+                buffer = io.StringIO()
+                writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+                writer.writerows(export_row(r) for r in batch)
+                yield buffer.getvalue()
+            else:
+                yield ''.join(json.dumps(export_row(r), ensure_ascii=False) + '\n' for r in batch)
+
+
+
+@router.post('/create', status_code=201)
+async def create_transaction(transaction: TransactionCreate, current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_write_db)):
+    new_transaction = await db.scalar(
+        insert(Transaction).values(user_id=current_user['id'], **transaction.model_dump()).returning(Transaction)
+    )
+    await db.commit()
+
+    return transaction_to_response(new_transaction)
+
+
+@router.post('/import', status_code=201)
+async def import_transactions(file: UploadFile = File(...), current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_write_db)):
+    stream = io.TextIOWrapper(file.file, encoding='utf-8-sig', newline='')
+    try:
+        report = await import_transactions_csv(db, current_user['id'], stream)
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        stream.detach()
+
+    return report
+
+
 @router.get('/list')
-def list_transactions(current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    transactions = db.query(Transaction).filter(Transaction.user_id == current_user['id']).all()
+async def list_transactions(current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_read_db)):
+    transactions = (await db.scalars(select(Transaction).where(Transaction.user_id == current_user['id']))).all()
     result = []
     for t in transactions:
         result.append({
@@ -65,11 +127,20 @@ def list_transactions(current_user: dict = Depends(get_current_user), db: Sessio
     return result
 
 
+@router.get('/export')
+async def export_transactions(format: Literal['ndjson', 'csv'] = Query('ndjson'), current_user: dict = Depends(get_current_user)):
+    return StreamingResponse(
+        stream_transactions(current_user['id'], format),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={'Content-Disposition': f'attachment; filename="transactions.{format}"'},
+    )
+
+
 @router.get('/{transaction_id}')
-def get_transaction(transaction_id: str, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    transaction = db.query(Transaction).filter(
+async def get_transaction(transaction_id: str, current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_read_db)):
+    transaction = await db.scalar(select(Transaction).where(
         (Transaction.id == transaction_id) & (Transaction.user_id == current_user['id'])
-    ).first()
+    ))
     
     if not transaction:
         raise HTTPException(status_code=404, detail='Transakcija nije pronađena')
@@ -84,44 +155,47 @@ def get_transaction(transaction_id: str, current_user: dict = Depends(get_curren
     }
 
 
-@router.put('/{transaction_id}')
-def update_transaction(transaction_id: str, transaction: TransactionCreate, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    existing_transaction = db.query(Transaction).filter(
-        (Transaction.id == transaction_id) & (Transaction.user_id == current_user['id'])
-    ).first()
-    
-    if not existing_transaction:
+async def update_transaction_columns(db: AsyncSession, transaction_id: str, user_id: str, values: dict) -> dict:
+    # One UPDATE ... RETURNING; a missing or foreign transaction simply matches no row.
+    transaction = await db.scalar(
+        update(Transaction)
+        .where((Transaction.id == transaction_id) & (Transaction.user_id == user_id))
+        .values(**values)
+        .returning(Transaction)
+    )
+
+    if not transaction:
         raise HTTPException(status_code=404, detail='Transakcija nije pronađena')
-    
-    existing_transaction.amount = transaction.amount
-    existing_transaction.merchant_name = transaction.merchant_name
-    existing_transaction.transaction_date = transaction.transaction_date
-    existing_transaction.status = transaction.status
-    
-    db.commit()
-    db.refresh(existing_transaction)
-    
-    return {
-        'id': str(existing_transaction.id),
-        'user_id': str(existing_transaction.user_id),
-        'amount': existing_transaction.amount,
-        'merchant_name': existing_transaction.merchant_name,
-        'transaction_date': str(existing_transaction.transaction_date),
-        'status': existing_transaction.status
-    }
+
+    await db.commit()
+    return transaction_to_response(transaction)
+
+
+@router.put('/{transaction_id}')
+async def update_transaction(transaction_id: str, transaction: TransactionCreate, current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_write_db)):
+    return await update_transaction_columns(db, transaction_id, current_user['id'], transaction.model_dump())
+
+
+@router.patch('/{transaction_id}')
+async def patch_transaction(transaction_id: str, transaction: TransactionUpdate, current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_write_db)):
+    values = transaction.model_dump(exclude_unset=True, exclude_none=True)
+    if not values:
+        raise HTTPException(status_code=400, detail='Nema polja za izmjenu')
+
+    return await update_transaction_columns(db, transaction_id, current_user['id'], values)
 
 
 @router.delete('/{transaction_id}')
-def delete_transaction(transaction_id: str, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    transaction = db.query(Transaction).filter(
-        (Transaction.id == transaction_id) & (Transaction.user_id == current_user['id'])
-    ).first()
-    
-    if not transaction:
+async def delete_transaction(transaction_id: str, current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_write_db)):
+    deleted_id = await db.scalar(
+        delete(Transaction)
+        .where((Transaction.id == transaction_id) & (Transaction.user_id == current_user['id']))
+        .returning(Transaction.id)
+    )
+
+    if not deleted_id:
         raise HTTPException(status_code=404, detail='Transakcija nije pronađena')
-    
-    db.delete(transaction)
-    db.commit()
-    
-    return {'message': 'Transakcija je obrisana'}
 
+    await db.commit()
+
+    return {'message': 'Transakcija je obrisana'}
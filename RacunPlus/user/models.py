@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String
+from sqlalchemy import Column, String, ForeignKey, Index, TIMESTAMP, func
 from RacunPlus.database import Base
 import uuid
 from sqlalchemy.dialects.postgresql import UUID
@@ -12,3 +12,21 @@ class User(Base):
     first_name = Column(String)
     last_name = Column(String)
     hashed_password = Column(String)
+
+    __table_args__ = (
+        Index('ix_users_username_lower', func.lower(username), unique=True),
+        Index('ix_users_email_lower', func.lower(email), unique=True),
+    )
+
+
+class RefreshToken(Base):
+    __tablename__ = 'refresh_tokens'
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    # Every refresh token issued from one login shares a family; reuse of a rotated token revokes the family.
+    family_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+    token_hash = Column(String(64), nullable=False, unique=True)
+    expires_at = Column(TIMESTAMP(timezone=True), nullable=False)
+    revoked_at = Column(TIMESTAMP(timezone=True), nullable=True)
+    created_at = Column(TIMESTAMP(timezone=True), default=func.now(), nullable=False)
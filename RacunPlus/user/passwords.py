@@ -0,0 +1,90 @@
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+from RacunPlus import metrics
+from RacunPlus.settings import settings
+
+bcrypt = CryptContext(schemes=['bcrypt'], deprecated='auto', bcrypt__rounds=settings.BCRYPT_ROUNDS)
+
+hash_seconds = metrics.histogram('password_hash_seconds')
+hash_rejected = metrics.counter('password_hash_rejected_total')
+
+_pool: Optional[ProcessPoolExecutor] = None
+_slots: Optional[asyncio.Semaphore] = None
+_waiting = 0
+_running = 0
+
+metrics.gauge('password_hash_queue_depth', lambda: _waiting)
+metrics.gauge('password_hash_in_flight', lambda: _running)
+
+
+def hash_password(password: str):
+    return bcrypt.hash(password)
+
+
+def verify_password(plain: str, hashed: str):
+    return bcrypt.verify(plain, hashed)
+
+
+def needs_rehash(hashed: str) -> bool:
+    # Cheap: only parses the cost out of the stored hash.
+    return bcrypt.needs_update(hashed)
+
+
+def start_pool():
+    global _pool, _slots
+    if _pool is None:
+        # spawn: forking a process that already runs the event loop and DB threads is unsafe.
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.PASSWORD_HASH_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+    # The semaphore belongs to the running loop, so it is recreated on every start.
+    _slots = asyncio.Semaphore(settings.PASSWORD_HASH_WORKERS)
+
+
+def shutdown_pool():
+    global _pool, _slots
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+    _pool = None
+    _slots = None
+
+
+async def _run(func, *args):
+    global _waiting, _running
+    if _slots is None:
+        start_pool()
+    if _waiting >= settings.PASSWORD_HASH_MAX_QUEUE:
+        hash_rejected.inc()
+        raise HTTPException(status_code=503, detail='Server je trenutno preopterećen, pokušajte ponovo')
+
+    slots = _slots
+    _waiting += 1
+    try:
+        await slots.acquire()
+    finally:
+        _waiting -= 1
+
+    _running += 1
+    started = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_pool, func, *args)
+    finally:
+        hash_seconds.observe(time.perf_counter() - started)
+        _running -= 1
+        slots.release()
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run(hash_password, password)
+
+
+async def verify_password_async(plain: str, hashed: str) -> bool:
+    return await _run(verify_password, plain, hashed)
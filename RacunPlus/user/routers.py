@@ -1,21 +1,31 @@
 from datetime import timedelta, datetime, timezone
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
-from RacunPlus.database import SessionLocal
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from RacunPlus.database import get_db
+from RacunPlus.dependencies import get_current_user, get_read_db, get_write_db
 from RacunPlus.settings import settings
-from .models import User
-from passlib.context import CryptContext
-from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
-from jose import jwt, JWTError
+from RacunPlus.cache import TTLCache
+from .models import RefreshToken, User
+from .passwords import hash_password_async, needs_rehash, verify_password_async
+from fastapi.security import OAuth2PasswordRequestForm
+from jose import jwt
+import hashlib
+import json
+import secrets
+import time
 import uuid
 
 router = APIRouter(prefix='/auth', tags=['auth'])
 
 SECRET_KEY = settings.SECRET_KEY
 ALGORITHM = settings.ALGORITHM
-bcrypt = CryptContext(schemes=['bcrypt'], deprecated='auto')
-oauth2 = OAuth2PasswordBearer(tokenUrl='auth/login')
+profile_cache = TTLCache('profile_cache', settings.PROFILE_CACHE_SIZE)
 
 
 class UserCreate(BaseModel):
@@ -26,87 +36,194 @@ class UserCreate(BaseModel):
     last_name: str
 
 
+class UserUpdate(BaseModel):
+    email: Optional[str] = None
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+
+
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
-def hash_password(password: str):
-    return bcrypt.hash(password)
-
-
-def verify_password(plain: str, hashed: str):
-    return bcrypt.verify(plain, hashed)
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 
 def create_token(username: str, user_id: str):
     encode = {'sub': username, 'id': str(user_id)}
-    expires = datetime.now(timezone.utc) + timedelta(minutes=60)
+    expires = datetime.now(timezone.utc) + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     encode['exp'] = expires
     return jwt.encode(encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
-def get_current_user(token: str = Depends(oauth2)):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get('sub')
-        user_id = payload.get('id')
-        if not username or not user_id:
-            raise HTTPException(status_code=401, detail='Greska sa tokenom')
-        return {'username': username, 'id': user_id}
-    except JWTError:
-        raise HTTPException(status_code=401, detail='Greska sa tokenom')
+def hash_refresh_token(token: str) -> str:
+    # The token is 256 random bits, so a plain SHA-256 is enough; no need for bcrypt here.
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+async def issue_refresh_token(db: AsyncSession, user_id, family_id=None) -> str:
+    token = secrets.token_urlsafe(32)
+    await db.execute(insert(RefreshToken).values(
+        user_id=user_id,
+        family_id=family_id or uuid.uuid4(),
+        token_hash=hash_refresh_token(token),
+        expires_at=datetime.now(timezone.utc) + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS),
+    ))
+    return token
 
 
 @router.post('/register', status_code=201)
-def register(user: UserCreate, db: Session = Depends(get_db)):
-    existing = db.query(User).filter(
-        (User.username == user.username) | (User.email == user.email)
-    ).first()
-    if existing:
+async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
+    # The unique indexes on lower(username)/lower(email) decide; no SELECT first, so concurrent signups cannot race.
+    created = await db.scalar(
+        pg_insert(User)
+        .values(
+            id=uuid.uuid4(),
+            username=user.username,
+            email=user.email,
+            hashed_password=await hash_password_async(user.password),
+            first_name=user.first_name,
+            last_name=user.last_name,
+        )
+        .on_conflict_do_nothing()
+        .returning(User.id)
+    )
+    if not created:
         raise HTTPException(status_code=400, detail='Korisnik već postoji')
 
-    new_user = User(
-        id=uuid.uuid4(),
-        username=user.username,
-        email=user.email,
-        hashed_password=hash_password(user.password),
-        first_name=user.first_name,
-        last_name=user.last_name,
-    )
-    db.add(new_user)
-    db.commit()
-    
+    await db.commit()
+
     return {'success': True, 'message': 'Korisnik je kreiran'}
 
 
 @router.post('/login', response_model=Token)
-def login(form: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(form: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
 
-    user = db.query(User).filter(User.username == form.username).first()
+    user = await db.scalar(select(User).where(func.lower(User.username) == func.lower(form.username)))
     if not user:
         raise HTTPException(status_code=401, detail='Pogresno korisnicko ime ili lozinka')
-    if not verify_password(form.password, user.hashed_password):
+    if not await verify_password_async(form.password, user.hashed_password):
         raise HTTPException(status_code=401, detail='Pogresno korisnicko ime ili lozinka')
-    
+
+    # The password is only known here, so hashes made with an older BCRYPT_ROUNDS are upgraded on login.
+    if needs_rehash(user.hashed_password):
+        await db.execute(update(User).where(User.id == user.id).values(
+            hashed_password=await hash_password_async(form.password)
+        ))
+
+    refresh_token = await issue_refresh_token(db, user.id)
+    await db.commit()
+
     token = create_token(user.username, user.id)
-    return {'access_token': token, 'token_type': 'bearer'}
+    return {'access_token': token, 'token_type': 'bearer', 'refresh_token': refresh_token}
+
+
+@router.post('/refresh', response_model=Token)
+async def refresh(body: RefreshRequest, db: AsyncSession = Depends(get_db)):
+    token_hash = hash_refresh_token(body.refresh_token)
+
+    # Revoking and reading in one UPDATE makes a token usable exactly once, even under concurrent refreshes.
+    used = (await db.execute(
+        update(RefreshToken)
+        .where(
+            (RefreshToken.token_hash == token_hash)
+            & RefreshToken.revoked_at.is_(None)
+            & (RefreshToken.expires_at > func.now())
+            & (RefreshToken.user_id == User.id)
+        )
+        .values(revoked_at=func.now())
+        .returning(RefreshToken.user_id, RefreshToken.family_id, User.username)
+    )).first()
+
+    if not used:
+        # A rotated token presented again means it leaked: revoke everything issued from that login.
+        await db.execute(
+            update(RefreshToken)
+            .where(
+                RefreshToken.family_id == select(RefreshToken.family_id).where(RefreshToken.token_hash == token_hash).scalar_subquery(),
+                RefreshToken.revoked_at.is_(None),
+            )
+            .values(revoked_at=func.now())
+        )
+        await db.commit()
+        raise HTTPException(status_code=401, detail='Neispravan refresh token')
+
+    refresh_token = await issue_refresh_token(db, used.user_id, used.family_id)
+    await db.commit()
+
+    token = create_token(used.username, used.user_id)
+    return {'access_token': token, 'token_type': 'bearer', 'refresh_token': refresh_token}
+
+
+@router.post('/logout')
+async def logout(body: RefreshRequest, db: AsyncSession = Depends(get_db)):
+    await db.execute(
+        update(RefreshToken)
+        .where(
+            RefreshToken.family_id == select(RefreshToken.family_id).where(RefreshToken.token_hash == hash_refresh_token(body.refresh_token)).scalar_subquery(),
+            RefreshToken.revoked_at.is_(None),
+        )
+        .values(revoked_at=func.now())
+    )
+    await db.commit()
+
+    return {'message': 'Odjava uspješna'}
+
+
+def profile_etag(profile: dict) -> str:
+    return '"' + hashlib.sha256(json.dumps(profile, sort_keys=True).encode()).hexdigest()[:32] + '"'
+
+
+def invalidate_profile(user_id):
+    # Only this process; other workers drop their copy after PROFILE_CACHE_SECONDS.
+    profile_cache.delete(str(user_id))
 
 
 @router.get('/current-user')
-def get_user_info(current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == current_user['id']).first()
+async def get_user_info(request: Request, current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_read_db)):
+    cached = profile_cache.get(current_user['id'])
+    if cached is None:
+        user = await db.scalar(select(User).where(User.id == current_user['id']))
+        if not user:
+            raise HTTPException(status_code=404, detail='Korisnik nije pronađen')
+
+        profile = {
+            'username': user.username,
+            'email': user.email,
+            'first_name': user.first_name,
+            'last_name': user.last_name,
+        }
+        cached = (profile, profile_etag(profile))
+        profile_cache.set(current_user['id'], cached, time.time() + settings.PROFILE_CACHE_SECONDS)
+
+    profile, etag = cached
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+    if request.headers.get('if-none-match') == etag:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(profile, headers=headers)
+
+
+@router.patch('/current-user')
+async def update_user_info(changes: UserUpdate, current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_write_db)):
+    values = changes.model_dump(exclude_unset=True, exclude_none=True)
+    if not values:
+        raise HTTPException(status_code=400, detail='Nema polja za izmjenu')
+
+    try:
+        user = await db.scalar(
+            update(User).where(User.id == current_user['id']).values(**values).returning(User)
+        )
+        await db.commit()
+    except IntegrityError:
+        raise HTTPException(status_code=400, detail='Email je već zauzet')
     if not user:
         raise HTTPException(status_code=404, detail='Korisnik nije pronađen')
-    
+
+    invalidate_profile(current_user['id'])
+
     return {
         'username': user.username,
         'email': user.email,
@@ -6,10 +6,12 @@ from sqlalchemy import pool
 from alembic import context
 
 from RacunPlus.database import Base
-from RacunPlus.user.models import User
+from RacunPlus.user.models import User, RefreshToken
 from RacunPlus.transaction.models import Transaction
 from RacunPlus.bill.models import Bill
 from RacunPlus.app.analysis.models.analysis import Analysis
+from RacunPlus.app.analysis.models.rate_limit import AnalysisRateLimit
+from RacunPlus.rollup.models import UserMonthlyRollup
 from RacunPlus.settings import settings
 
 config = context.config
@@ -0,0 +1,32 @@
+"""add per user composite indexes
+
+Revision ID: 441e54ca6509
+Revises: 988779dc2ef7
+Create Date: 2026-10-18 10:12:41.503118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '441e54ca6509'
+down_revision: Union[str, Sequence[str], None] = '988779dc2ef7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_bills_user_id_reference_date', 'bills', ['user_id', 'reference_date', 'id'], unique=False)
+    op.create_index('ix_transaction_user_id_transaction_date', 'transaction', ['user_id', 'transaction_date'], unique=False)
+    op.create_index('ix_analysis_user_id_created_at', 'analysis', ['user_id', sa.text('created_at DESC')], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_analysis_user_id_created_at', table_name='analysis')
+    op.drop_index('ix_transaction_user_id_transaction_date', table_name='transaction')
+    op.drop_index('ix_bills_user_id_reference_date', table_name='bills')
@@ -0,0 +1,30 @@
+"""add analysis fingerprint
+
+Revision ID: 7473d9983eb2
+Revises: fcd002916a4d
+Create Date: 2026-10-18 16:44:05.271934
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7473d9983eb2'
+down_revision: Union[str, Sequence[str], None] = 'fcd002916a4d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('analysis', sa.Column('fingerprint', sa.String(length=64), nullable=True))
+    op.create_index('ix_analysis_user_id_fingerprint', 'analysis', ['user_id', 'fingerprint'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_analysis_user_id_fingerprint', table_name='analysis')
+    op.drop_column('analysis', 'fingerprint')
@@ -0,0 +1,152 @@
+"""create user monthly rollup
+
+Revision ID: c1744ee18ae4
+Revises: 441e54ca6509
+Create Date: 2026-10-18 13:40:02.117934
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c1744ee18ae4'
+down_revision: Union[str, Sequence[str], None] = '441e54ca6509'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Frozen copy of CATEGORY_MAP from services/data_aggregator.py at the time of this revision.
+CATEGORY_SQL = """
+CREATE OR REPLACE FUNCTION rollup_category(name text) RETURNS text
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT CASE trim(name)
+        WHEN 'EPCG' THEN 'Electricity'
+        WHEN 'Vodovod' THEN 'Water'
+        WHEN 'Telemach' THEN 'Internet'
+        WHEN 'Crnogorski Telekom' THEN 'Phone'
+        ELSE 'Other'
+    END
+$$
+"""
+
+# Buckets emptied by an UPDATE/DELETE; limited to the keys of old_rows so it is a primary key lookup.
+DELETE_EMPTY_SQL = """DELETE FROM user_monthly_rollup r
+        USING (
+            SELECT DISTINCT user_id, date_trunc('month', {date_column})::date AS month,
+                   rollup_category({name_column}) AS category
+            FROM old_rows
+        ) a
+        WHERE r.user_id = a.user_id AND r.source = '{source}' AND r.month = a.month AND r.category = a.category
+          AND r.item_count <= 0;"""
+
+# Statement level trigger over the transition tables. Sums and counts are applied as deltas,
+# which commute between concurrent writers; min/max of buckets that lost rows are re-read
+# from the base table, since they cannot be derived from a delta.
+TRIGGER_FUNCTION_SQL = """
+CREATE OR REPLACE FUNCTION rollup_{table}() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO user_monthly_rollup AS r (user_id, source, month, category, total_amount, item_count)
+        SELECT user_id, '{source}', date_trunc('month', {date_column})::date, rollup_category({name_column}),
+               -sum(amount), -count(*)
+        FROM old_rows
+        GROUP BY 1, 2, 3, 4
+        ON CONFLICT (user_id, source, month, category) DO UPDATE
+        SET total_amount = r.total_amount + EXCLUDED.total_amount,
+            item_count = r.item_count + EXCLUDED.item_count;
+
+        {delete_empty}
+
+        UPDATE user_monthly_rollup r
+        SET min_amount = f.min_amount, max_amount = f.max_amount
+        FROM (
+            SELECT DISTINCT user_id, date_trunc('month', {date_column})::date AS month,
+                   rollup_category({name_column}) AS category
+            FROM old_rows
+        ) a,
+        LATERAL (
+            SELECT min(t.amount) AS min_amount, max(t.amount) AS max_amount
+            FROM "{table}" t
+            WHERE t.user_id = a.user_id
+              AND t.{date_column} >= a.month
+              AND t.{date_column} < a.month + interval '1 month'
+              AND rollup_category(t.{name_column}) = a.category
+        ) f
+        WHERE r.user_id = a.user_id AND r.source = '{source}' AND r.month = a.month AND r.category = a.category;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO user_monthly_rollup AS r (user_id, source, month, category, total_amount, item_count, min_amount, max_amount)
+        SELECT user_id, '{source}', date_trunc('month', {date_column})::date, rollup_category({name_column}),
+               sum(amount), count(*), min(amount), max(amount)
+        FROM new_rows
+        GROUP BY 1, 2, 3, 4
+        ON CONFLICT (user_id, source, month, category) DO UPDATE
+        SET total_amount = r.total_amount + EXCLUDED.total_amount,
+            item_count = r.item_count + EXCLUDED.item_count,
+            min_amount = least(r.min_amount, EXCLUDED.min_amount),
+            max_amount = greatest(r.max_amount, EXCLUDED.max_amount);
+    END IF;
+
+    RETURN NULL;
+END
+$$
+"""
+
+TRIGGERS_SQL = """
+CREATE TRIGGER rollup_{table}_insert AFTER INSERT ON "{table}"
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION rollup_{table}();
+CREATE TRIGGER rollup_{table}_update AFTER UPDATE ON "{table}"
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION rollup_{table}();
+CREATE TRIGGER rollup_{table}_delete AFTER DELETE ON "{table}"
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION rollup_{table}();
+"""
+
+BACKFILL_SQL = """
+INSERT INTO user_monthly_rollup (user_id, source, month, category, total_amount, item_count, min_amount, max_amount)
+SELECT user_id, '{source}', date_trunc('month', {date_column})::date, rollup_category({name_column}),
+       sum(amount), count(*), min(amount), max(amount)
+FROM "{table}"
+GROUP BY 1, 2, 3, 4
+"""
+
+SOURCES = [
+    {'table': 'bills', 'source': 'bill', 'date_column': 'reference_date', 'name_column': 'beneficiary_name'},
+    {'table': 'transaction', 'source': 'transaction', 'date_column': 'transaction_date', 'name_column': 'merchant_name'},
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('user_monthly_rollup',
+    sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('source', sa.String(), nullable=False),
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('category', sa.String(), nullable=False),
+    sa.Column('total_amount', sa.Float(), nullable=False),
+    sa.Column('item_count', sa.Integer(), nullable=False),
+    sa.Column('min_amount', sa.Float(), nullable=True),
+    sa.Column('max_amount', sa.Float(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'source', 'month', 'category')
+    )
+    op.execute(CATEGORY_SQL)
+    for source in SOURCES:
+        op.execute(TRIGGER_FUNCTION_SQL.format(delete_empty=DELETE_EMPTY_SQL.format(**source), **source))
+        op.execute(TRIGGERS_SQL.format(**source))
+        op.execute(BACKFILL_SQL.format(**source))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for source in SOURCES:
+        for event in ('insert', 'update', 'delete'):
+            op.execute(f'DROP TRIGGER IF EXISTS rollup_{source["table"]}_{event} ON "{source["table"]}"')
+        op.execute(f'DROP FUNCTION IF EXISTS rollup_{source["table"]}()')
+    op.execute('DROP FUNCTION IF EXISTS rollup_category(text)')
+    op.drop_table('user_monthly_rollup')
@@ -0,0 +1,31 @@
+"""add case insensitive user indexes
+
+Revision ID: fcd002916a4d
+Revises: 1edf3cda967a
+Create Date: 2026-10-18 15:58:12.640391
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'fcd002916a4d'
+down_revision: Union[str, Sequence[str], None] = '1edf3cda967a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Fails if existing users differ only by case; those have to be merged by hand first.
+    op.create_index('ix_users_username_lower', 'users', [sa.text('lower(username)')], unique=True)
+    op.create_index('ix_users_email_lower', 'users', [sa.text('lower(email)')], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_users_email_lower', table_name='users')
+    op.drop_index('ix_users_username_lower', table_name='users')
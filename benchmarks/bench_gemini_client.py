@@ -0,0 +1,53 @@
+"""Per-request cost of building a Gemini client vs. reusing the shared one.
+
+    python -m benchmarks.bench_gemini_client --iterations 200
+
+Runs offline: it times everything generate_analysis used to do before the
+first byte is sent (the async gRPC client and its channel). The TLS/HTTP2 handshake a fresh channel pays on its first call
+comes on top of this and is not measured here.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from RacunPlus.app.analysis.services.ai_service import GeminiAIService, close_ai_service, get_ai_service
+
+
+async def per_request(iterations: int) -> list:
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        service = GeminiAIService()
+        service.connect()
+        timings.append(time.perf_counter() - started)
+        await service.aclose()
+    return timings
+
+
+async def shared(iterations: int) -> list:
+    get_ai_service()
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        get_ai_service().connect()
+        timings.append(time.perf_counter() - started)
+    await close_ai_service()
+    return timings
+
+
+def describe(name: str, timings: list):
+    print(f'{name:<14} p50 {statistics.median(timings) * 1000:8.3f} ms   max {max(timings) * 1000:8.3f} ms')
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    describe('per request', await per_request(args.iterations))
+    describe('shared client', await shared(args.iterations))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
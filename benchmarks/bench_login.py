@@ -0,0 +1,80 @@
+"""Login throughput under concurrency, and how a cheap endpoint fares meanwhile.
+
+    python -m benchmarks.bench_login --logins 200 --concurrency 32
+
+bcrypt runs in the PASSWORD_HASH_WORKERS process pool, so /metrics latency
+should stay flat while the login burst is running.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+import httpx
+from sqlalchemy import delete
+
+from RacunPlus.database import SessionLocal
+from RacunPlus.main import app
+from RacunPlus.settings import settings
+from RacunPlus.user.models import User
+from RacunPlus.user.passwords import hash_password_async
+
+
+async def login_burst(client: httpx.AsyncClient, username: str, logins: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def login():
+        async with semaphore:
+            response = await client.post('/auth/login', data={'username': username, 'password': 'bench123'})
+            assert response.status_code == 200, response.text
+
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    return time.perf_counter() - started
+
+
+async def probe_latency(client: httpx.AsyncClient, stop: asyncio.Event) -> list:
+    latencies = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        await client.get('/metrics')
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(0.01)
+    return latencies
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=32)
+    args = parser.parse_args()
+
+    async with app.router.lifespan_context(app):
+        user_id = uuid.uuid4()
+        username = f'bench_{user_id.hex[:8]}'
+        async with SessionLocal() as db:
+            db.add(User(id=user_id, username=username, email=None, hashed_password=await hash_password_async('bench123')))
+            await db.commit()
+
+        transport = httpx.ASGITransport(app=app)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+                stop = asyncio.Event()
+                probe = asyncio.create_task(probe_latency(client, stop))
+                elapsed = await login_burst(client, username, args.logins, args.concurrency)
+                stop.set()
+                latencies = await probe
+        finally:
+            async with SessionLocal() as db:
+                await db.execute(delete(User).where(User.id == user_id))
+                await db.commit()
+
+    print(f'bcrypt rounds:    {settings.BCRYPT_ROUNDS}, hash workers: {settings.PASSWORD_HASH_WORKERS}')
+    print(f'logins:           {args.logins} at concurrency {args.concurrency}')
+    print(f'throughput:       {args.logins / elapsed:,.1f} logins/s')
+    print(f'/metrics p50/max: {statistics.median(latencies) * 1000:.1f} ms / {max(latencies) * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
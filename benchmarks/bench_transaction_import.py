@@ -0,0 +1,87 @@
+"""Throughput of the COPY based statement import vs. one INSERT per row.
+
+    python -m benchmarks.bench_transaction_import --rows 50000
+"""
+import argparse
+import asyncio
+import io
+import random
+import time
+import uuid
+from datetime import date, timedelta
+
+from sqlalchemy import delete
+
+from RacunPlus.database import SessionLocal, engine
+from RacunPlus.transaction.importer import import_transactions_csv
+from RacunPlus.transaction.models import Transaction
+from RacunPlus.user.models import User
+
+
+MERCHANTS = ['Voli', 'Idea', 'HDL', 'Aroma', 'Jugopetrol', 'Apoteka Montefarm']
+
+
+def make_statement(rows: int) -> io.StringIO:
+    start = date(2020, 1, 1)
+    lines = ['Datum,Opis,Iznos']
+    for i in range(rows):
+        day = start + timedelta(days=i % 2000)
+        lines.append(f'{day:%d.%m.%Y},{random.choice(MERCHANTS)} {i},"{random.uniform(1, 300):.2f}"')
+    return io.StringIO('\n'.join(lines) + '\n')
+
+
+async def bench_copy(user_id, rows: int) -> float:
+    statement = make_statement(rows)
+    async with SessionLocal() as db:
+        started = time.perf_counter()
+        report = await import_transactions_csv(db, user_id, statement)
+        elapsed = time.perf_counter() - started
+    assert report['inserted'] == rows, report
+    return rows / elapsed
+
+
+async def bench_row_by_row(user_id, rows: int) -> float:
+    async with SessionLocal() as db:
+        started = time.perf_counter()
+        for i in range(rows):
+            t = Transaction(
+                user_id=user_id,
+                amount=random.uniform(1, 300),
+                merchant_name=f'{random.choice(MERCHANTS)} single {i}',
+                transaction_date=date.today(),
+                status='completed',
+            )
+            db.add(t)
+            await db.commit()
+            await db.refresh(t)
+        elapsed = time.perf_counter() - started
+    return rows / elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--single-rows', type=int, default=500)
+    args = parser.parse_args()
+
+    user_id = uuid.uuid4()
+    async with SessionLocal() as db:
+        db.add(User(id=user_id, username=f'bench_{user_id.hex[:8]}', email=None, hashed_password=''))
+        await db.commit()
+
+    try:
+        copy_rate = await bench_copy(str(user_id), args.rows)
+        single_rate = await bench_row_by_row(user_id, args.single_rows)
+        print(f'COPY import:     {args.rows} rows, {copy_rate:,.0f} rows/s')
+        print(f'INSERT per row:  {args.single_rows} rows, {single_rate:,.0f} rows/s')
+        print(f'speedup:         {copy_rate / single_rate:.1f}x')
+    finally:
+        async with SessionLocal() as db:
+            await db.execute(delete(Transaction).where(Transaction.user_id == user_id))
+            await db.execute(delete(User).where(User.id == user_id))
+            await db.commit()
+        await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,13 @@
+import pytest
+
+
+@pytest.fixture(autouse=True, scope='module')
+def client_lifespan(request):
+    # Run each module's requests on one event loop so pooled asyncpg connections stay valid,
+    # and let the app lifespan dispose the pool before the next module starts its own loop.
+    client = getattr(request.module, 'client', None)
+    if client is None:
+        yield
+        return
+    with client:
+        yield
@@ -1,6 +1,26 @@
-from datetime import date
+import asyncio
+import json
+import time
+import uuid
+from datetime import date, timedelta
+from google.ai import generativelanguage as glm
+import pytest
 from fastapi.testclient import TestClient
 from RacunPlus.main import app
+from RacunPlus.metrics import snapshot
+from RacunPlus.settings import settings
+from RacunPlus.app.analysis.api import analysis as analysis_api
+from RacunPlus.app.analysis.api.analysis import ClientDisconnectedError, cancel_on_disconnect
+from RacunPlus.database import SessionLocal
+from RacunPlus.app.analysis.cli import Checkpoint, main as cli_main, run_batch, users_with_new_bills
+from RacunPlus.app.analysis.database.analysis import create_analysis
+from RacunPlus.app.analysis.models.analysis import Analysis
+from RacunPlus.app.analysis.services.prompt_builder import build_monthly_prompt, estimate_tokens
+from RacunPlus.app.analysis.schemas.analysis import CategoryInsights, MonthlyInsights
+from RacunPlus.app.analysis.services.ai_service import FALLBACK_MODEL, GeminiAIService, get_ai_service
+from RacunPlus.app.analysis.services.local_engine import category_insights
+from RacunPlus.app.analysis.services import jobs
+from RacunPlus.app.analysis.services.rate_limit import DatabaseRateLimiter, MemoryRateLimiter
 
 client = TestClient(app)
 
@@ -19,6 +39,29 @@ def get_auth_token():
     return response.json()["access_token"]
 
 
+def add_bill(headers, amount, provider, days_ago=0, status="paid"):
+    return client.post("/bills/create", json={
+        "amount": amount,
+        "beneficiary_name": provider,
+        "reference_date": str(date.today() - timedelta(days=days_ago)),
+        "status": status
+    }, headers=headers).json()["user_id"]
+
+
+def new_user_with_bill(amount, provider):
+    unique_id = uuid.uuid4().hex[:8]
+    client.post("/auth/register", json={
+        "username": f"analysis_{unique_id}",
+        "email": f"analysis_{unique_id}@example.com",
+        "password": "pass123",
+        "first_name": "Analysis",
+        "last_name": "User"
+    })
+    token = client.post("/auth/login", data={"username": f"analysis_{unique_id}", "password": "pass123"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    return headers, add_bill(headers, amount, provider)
+
+
 def test_1_generate_monthly_analysis():
     token = get_auth_token()
     headers = {"Authorization": f"Bearer {token}"}
@@ -66,3 +109,420 @@ def test_3_analysis_bez_auth():
     })
     print(f"Without auth: {response.status_code}")
     assert response.status_code in [401, 403]
+
+
+def test_4_generate_gemini_timeout(monkeypatch):
+    headers, _ = new_user_with_bill(70.0, "EPCG")
+
+    async def slow_generate(self, *args, **kwargs):
+        await asyncio.sleep(5)
+
+    monkeypatch.setattr(glm.GenerativeServiceAsyncClient, "generate_content", slow_generate)
+    monkeypatch.setattr(settings, "GEMINI_TIMEOUT_SECONDS", 0.2)
+
+    before = snapshot()["gemini_timeouts_total"]
+    started = time.perf_counter()
+    response = client.post("/analysis/generate", json={"analysis_type": "monthly", "days": 30}, headers=headers)
+    print(f"Generate with slow Gemini: {response.status_code}")
+    assert response.status_code == 201
+    assert time.perf_counter() - started < 3
+    assert response.json()["data"]["total_amount"] == 70.0
+    assert snapshot()["gemini_timeouts_total"] == before + 1
+
+
+def test_5_cancel_on_disconnect():
+    class DisconnectedRequest:
+        async def is_disconnected(self):
+            return True
+
+    cancelled = []
+
+    async def slow_call():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    with pytest.raises(ClientDisconnectedError):
+        asyncio.run(cancel_on_disconnect(DisconnectedRequest(), slow_call()))
+    assert cancelled == [True]
+
+
+def test_6_shared_ai_service(monkeypatch):
+    clients = []
+
+    async def fake_generate_content(self, request, **kwargs):
+        clients.append(self)
+        return glm.GenerateContentResponse(
+            candidates=[glm.Candidate(content=glm.Content(parts=[glm.Part(text='{"summary": "ok"}')]))],
+            usage_metadata=glm.GenerateContentResponse.UsageMetadata(total_token_count=42),
+        )
+
+    monkeypatch.setattr(glm.GenerativeServiceAsyncClient, "generate_content", fake_generate_content)
+
+    async def generate_twice():
+        return [await get_ai_service().generate(prompt) for prompt in ("prvi", "drugi")]
+
+    results = client.portal.call(generate_twice)
+    print(f"Shared AI client: {len(set(map(id, clients)))} client(s) for {len(clients)} calls")
+    assert results[0] == ({"summary": "ok"}, 42)
+    assert get_ai_service() is get_ai_service()
+    assert len(clients) == 2 and clients[0] is clients[1]
+
+
+def test_7_generate_reuses_cached_analysis(monkeypatch):
+    headers, _ = new_user_with_bill(42.0, "Vodovod")
+
+    calls = []
+
+    async def fake_generate(self, prompt):
+        calls.append(prompt)
+        return {"summary": "ok", "breakdown": [], "recommendations": []}, 120
+
+    monkeypatch.setattr(GeminiAIService, "generate", fake_generate)
+
+    first = client.post("/analysis/generate", json={"analysis_type": "monthly", "days": 30}, headers=headers)
+    second = client.post("/analysis/generate", json={"analysis_type": "monthly", "days": 30}, headers=headers)
+    print(f"Cached analysis: {second.json()['cached']}")
+    assert first.status_code == second.status_code == 201
+    assert first.json()["cached"] is False
+    assert second.json()["cached"] is True
+    assert second.json()["data"]["analysis_id"] == first.json()["data"]["analysis_id"]
+    assert len(calls) == 1
+    assert 0 < snapshot()["analysis_cache_hit_rate"] <= 1
+
+    async def stored():
+        async with SessionLocal() as db:
+            return await db.get(Analysis, uuid.UUID(first.json()["data"]["analysis_id"]))
+
+    analysis = client.portal.call(stored)
+    assert analysis.prompt == calls[0]
+    assert analysis.tokens_used == 120
+
+    # New data changes the fingerprint.
+    add_bill(headers, 8.0, "Vodovod")
+    third = client.post("/analysis/generate", json={"analysis_type": "monthly", "days": 30}, headers=headers)
+    assert third.json()["cached"] is False
+    assert len(calls) == 2
+
+    # So does a token budget that builds a differently sized prompt.
+    monkeypatch.setattr(settings, "ANALYSIS_PROMPT_TOKEN_BUDGET", 100)
+    fourth = client.post("/analysis/generate", json={"analysis_type": "monthly", "days": 30}, headers=headers)
+    assert fourth.json()["cached"] is False
+    assert len(calls) == 3
+
+
+def test_8_generate_job_mode(monkeypatch):
+    headers, user_id = new_user_with_bill(33.0, "Telemach")
+
+    async def fake_generate(self, prompt):
+        await asyncio.sleep(0.3)
+        return {"summary": "job", "categories": [], "recommendations": []}, 90
+
+    monkeypatch.setattr(GeminiAIService, "generate", fake_generate)
+
+    response = client.post("/analysis/generate?mode=job", json={"analysis_type": "category", "days": 30}, headers=headers)
+    print(f"Generate job: {response.status_code}")
+    assert response.status_code == 202
+    data = response.json()["data"]
+    assert data["status"] in ("pending", "running")
+    assert response.headers["location"] == f"/analysis/{data['analysis_id']}"
+    assert "analysis_queue_depth" in snapshot()
+
+    response = client.get(f"/analysis/{data['analysis_id']}?wait=10", headers=headers)
+    print(f"Long-poll job: {response.status_code}")
+    assert response.status_code == 200
+    assert response.json()["data"]["status"] == "completed"
+    assert response.json()["data"]["insights"]["summary"] == "job"
+
+    # A pending row this process does not own is re-read once per poll interval, not in a loop.
+    async def add_pending():
+        async with SessionLocal() as db:
+            analysis = await create_analysis(db, Analysis(
+                user_id=user_id,
+                analysis_type="category",
+                period_start=date.today(),
+                period_end=date.today(),
+                total_amount=0,
+                bills_count=0,
+                prompt="",
+                ai_response={},
+                status="pending",
+            ))
+            return analysis.id
+
+    pending_id = client.portal.call(add_pending)
+    reads = []
+    get_analysis_by_id = analysis_api.get_analysis_by_id
+
+    async def counting_get(*args):
+        reads.append(args)
+        return await get_analysis_by_id(*args)
+
+    monkeypatch.setattr(analysis_api, "get_analysis_by_id", counting_get)
+    monkeypatch.setattr(analysis_api, "JOB_POLL_SECONDS", 0.5)
+    response = client.get(f"/analysis/{pending_id}?wait=2", headers=headers)
+    print(f"Long-poll orphan job: {response.status_code}, {len(reads)} reads")
+    assert response.json()["data"]["status"] == "pending"
+    assert len(reads) <= 2 / 0.5 + 2
+
+
+def test_9_nightly_batch(monkeypatch, tmp_path):
+    headers, user_id = new_user_with_bill(61.0, "EPCG")
+
+    async def fake_generate(self, prompt):
+        return {"summary": "batch", "breakdown": [], "categories": [], "recommendations": []}, 100
+
+    monkeypatch.setattr(GeminiAIService, "generate", fake_generate)
+    checkpoint_path = tmp_path / "batch.checkpoint"
+
+    async def batch():
+        return await run_batch(30, 2, 6000, Checkpoint(checkpoint_path), [user_id])
+
+    stats = client.portal.call(batch)
+    print(f"Nightly batch: {stats}")
+    assert stats["users"] == 1 and stats["generated"] == 2
+    assert not checkpoint_path.exists()
+
+    response = client.get("/analysis/latest", params={"analysis_type": "category"}, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["data"]["insights"]["summary"] == "batch"
+
+    # Nothing new since the last analysis.
+    assert client.portal.call(batch)["users"] == 0
+
+    # A user already in the checkpoint of today's interrupted run is skipped on resume.
+    add_bill(headers, 5.0, "EPCG")
+    checkpoint_path.write_text(f"run {date.today().isoformat()}\n{user_id}\n")
+    assert client.portal.call(batch)["users"] == 0
+
+    # A checkpoint left by an earlier day's run does not hide users with new bills.
+    checkpoint_path.write_text(f"run {(date.today() - timedelta(days=1)).isoformat()}\n{user_id}\n")
+    stats = client.portal.call(batch)
+    assert stats["users"] == 1 and stats["generated"] == 2
+    assert not checkpoint_path.exists()
+
+    with pytest.raises(SystemExit):
+        cli_main(["--rpm", "0"])
+
+
+def test_10_prompt_builder_budget():
+    bills = [
+        {
+            "id": str(uuid.uuid4()),
+            "beneficiary_name": f"Provajder {i % 40}",
+            "amount": 900.0 if i == 7 else 20.0 + i % 5,
+            "reference_date": date(2024, 1 + i % 12, 1 + i % 28),
+            "category": "Other",
+        }
+        for i in range(2000)
+    ]
+    prompt = build_monthly_prompt(bills, budget=1500)
+    print(f"Prompt tokens: {estimate_tokens(prompt)}")
+    assert estimate_tokens(prompt) <= 1500
+    assert "UKUPNO" in prompt and "Provajder 7" in prompt
+
+    detailed = build_monthly_prompt(bills, budget=100000)
+    assert "NEUOBIČAJENI RAČUNI" in detailed and "900.0" in detailed
+
+
+def test_11_generate_stream(monkeypatch):
+    headers, _ = new_user_with_bill(70.0, "Crnogorski Telekom")
+
+    answer = '{"summary": "stream", "categories": [{"name": "Telekom", "total_amount": 70, "percentage": 100, "insight": "sve"}], "recommendations": ["a"]}'
+
+    async def fake_stream(self, prompt):
+        for i in range(0, len(answer), 40):
+            yield answer[i:i + 40], None
+        yield "", 150
+
+    monkeypatch.setattr(GeminiAIService, "stream", fake_stream)
+
+    response = client.post("/analysis/generate/stream", json={"analysis_type": "category", "days": 30}, headers=headers)
+    print(f"Generate stream: {response.status_code}")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = [block.split("\n", 1) for block in response.text.strip().split("\n\n")]
+    names = [name.removeprefix("event: ") for name, _ in events]
+    assert names[0] == "delta" and names[-1] == "result" and "fallback" not in names
+    text = "".join(json.loads(data.removeprefix("data: "))["text"] for name, data in events if name == "event: delta")
+    assert text == answer
+
+    result = json.loads(events[-1][1].removeprefix("data: "))
+    assert result["cached"] is False
+    assert result["data"]["insights"]["summary"] == "stream"
+
+    async def stored():
+        async with SessionLocal() as db:
+            return await db.get(Analysis, uuid.UUID(result["data"]["analysis_id"]))
+
+    assert client.portal.call(stored).tokens_used == 150
+
+    # Same bills: the stored analysis comes back as the only event.
+    response = client.post("/analysis/generate/stream", json={"analysis_type": "category", "days": 30}, headers=headers)
+    assert response.text.startswith("event: result")
+    assert json.loads(response.text.split("data: ", 1)[1])["cached"] is True
+
+    # Broken JSON from the model is replaced by the rule-based answer.
+    async def broken_stream(self, prompt):
+        yield '{"summary": "nedovrš', None
+
+    monkeypatch.setattr(GeminiAIService, "stream", broken_stream)
+    response = client.post("/analysis/generate/stream", json={"analysis_type": "monthly", "days": 30}, headers=headers)
+    assert "event: fallback" in response.text
+    result = json.loads(response.text.rsplit("data: ", 1)[1])
+    assert result["data"]["insights"]["total_amount"] == 70.0
+
+
+def test_12_local_engine(monkeypatch):
+    headers, user_id = new_user_with_bill(25.0, "Crnogorski Telekom")
+    add_bill(headers, 40.0, "EPCG", days_ago=40)
+    add_bill(headers, 42.0, "EPCG", days_ago=35)
+    add_bill(headers, 150.0, "EPCG", days_ago=1, status="unpaid")
+    add_bill(headers, 20.0, "Telemach", days_ago=38)
+
+    # The local engine does not count against the AI limit.
+    monkeypatch.setattr(settings, "ANALYSIS_RATE_LIMIT", 0)
+
+    response = client.post("/analysis/generate?engine=local", json={"analysis_type": "monthly", "days": 60}, headers=headers)
+    print(f"Local monthly analysis: {response.status_code}")
+    assert response.status_code == 201
+    insights = MonthlyInsights.model_validate(response.json()["data"]["insights"])
+    assert insights.total_amount == 277.0
+    assert insights.breakdown[0].provider == "EPCG" and insights.breakdown[0].category == "Electricity"
+    assert len(insights.recommendations) >= 3
+    assert any("neplaćenih" in r for r in insights.recommendations)
+
+    response = client.post("/analysis/generate?engine=local", json={"analysis_type": "category", "days": 60}, headers=headers)
+    assert response.status_code == 201
+    insights = CategoryInsights.model_validate(response.json()["data"]["insights"])
+    assert [c.name for c in insights.categories] == ["Electricity", "Phone", "Internet"]
+    assert round(sum(c.percentage for c in insights.categories)) == 100
+
+    async def stored():
+        async with SessionLocal() as db:
+            return await db.get(Analysis, uuid.UUID(response.json()["data"]["analysis_id"]))
+
+    assert client.portal.call(stored).model_used == "local"
+
+    # A local analysis does not count as up to date for the nightly batch.
+    async def pending_users():
+        return await users_with_new_bills(60, [user_id])
+
+    assert client.portal.call(pending_users) == [user_id]
+
+    response = client.post("/analysis/generate", json={"analysis_type": "category", "days": 60}, headers=headers)
+    assert response.status_code == 429
+
+    bills = [
+        {
+            "id": str(i),
+            "beneficiary_name": f"Provajder {i % 30}",
+            "amount": 20.0 + i % 7,
+            "reference_date": date(2024, 1 + i % 12, 1 + i % 28),
+            "status": "paid",
+            "category": "Other",
+        }
+        for i in range(1000)
+    ]
+    started = time.perf_counter()
+    category_insights(bills)
+    elapsed = time.perf_counter() - started
+    print(f"Local engine, 1000 bills: {elapsed * 1000:.1f} ms")
+    assert elapsed < 0.05
+
+
+def test_13_gemini_breaker(monkeypatch):
+    async def failing_generate(self, *args, **kwargs):
+        raise RuntimeError("Gemini ne radi")
+
+    monkeypatch.setattr(glm.GenerativeServiceAsyncClient, "generate_content", failing_generate)
+    monkeypatch.setattr(settings, "GEMINI_BREAKER_FAILURES", 2)
+    service = GeminiAIService()
+    bills = [{"id": "1", "beneficiary_name": "EPCG", "amount": 30.0, "reference_date": date.today(), "status": "paid", "category": "Electricity"}]
+
+    async def run():
+        return [await service.generate_monthly_analysis(bills) for _ in range(3)]
+
+    before = snapshot()["gemini_breaker_skips_total"]
+    results = asyncio.run(run())
+    print(f"Gemini breaker open: {service.breaker_open()}")
+    assert service.breaker_open()
+    assert all(r.model_used == FALLBACK_MODEL for r in results)
+    assert results[0].insights["total_amount"] == 30.0
+    assert snapshot()["gemini_breaker_skips_total"] == before + 1
+
+
+def test_14_rate_limit_headers(monkeypatch):
+    async def fake_generate(self, prompt):
+        return {"summary": "limit", "breakdown": [], "recommendations": []}, 10
+
+    monkeypatch.setattr(GeminiAIService, "generate", fake_generate)
+    monkeypatch.setattr(settings, "ANALYSIS_RATE_LIMIT", 2)
+
+    headers, user_id = new_user_with_bill(10.0, "Vodovod")
+    remaining = []
+    for amount in (11.0, 12.0):
+        response = client.post("/analysis/generate", json={"analysis_type": "monthly", "days": 30}, headers=headers)
+        assert response.status_code == 201
+        assert response.headers["x-ratelimit-limit"] == "2"
+        remaining.append(response.headers["x-ratelimit-remaining"])
+        add_bill(headers, amount, "Vodovod")
+    assert remaining == ["1", "0"]
+
+    response = client.post("/analysis/generate", json={"analysis_type": "monthly", "days": 30}, headers=headers)
+    print(f"Generate over limit: {response.status_code}")
+    assert response.status_code == 429
+    assert response.headers["x-ratelimit-remaining"] == "0"
+    assert 0 < int(response.headers["retry-after"]) <= 86400
+
+    # The local engine does not need a slot.
+    response = client.post("/analysis/generate?engine=local", json={"analysis_type": "category", "days": 30}, headers=headers)
+    assert response.status_code == 201
+
+    # Concurrent requests of one user cannot take more slots than the limit.
+    monkeypatch.setattr(settings, "ANALYSIS_RATE_LIMIT", 5)
+
+    async def hits():
+        limiter = DatabaseRateLimiter()
+
+        async def hit():
+            async with SessionLocal() as db:
+                return (await limiter.hit(db, user_id)).allowed
+
+        return await asyncio.gather(*(hit() for _ in range(8)))
+
+    allowed = client.portal.call(hits)
+    assert allowed.count(True) == 3
+
+    memory = MemoryRateLimiter()
+
+    async def memory_hits():
+        return [(await memory.hit(None, user_id)).remaining for _ in range(6)]
+
+    assert asyncio.run(memory_hits()) == [4, 3, 2, 1, 0, 0]
+
+    async def memory_release():
+        await memory.release(None, user_id)
+        return (await memory.peek(None, user_id)).remaining
+
+    assert asyncio.run(memory_release()) == 1
+
+    # A job that could not be queued gives its slot back.
+    def queue_full(*args):
+        raise jobs.QueueFullError()
+
+    monkeypatch.setattr(jobs, "enqueue", queue_full)
+    headers, user_id = new_user_with_bill(13.0, "Vodovod")
+
+    async def remaining():
+        async with SessionLocal() as db:
+            return (await DatabaseRateLimiter().peek(db, user_id)).remaining
+
+    before = client.portal.call(remaining)
+    response = client.post("/analysis/generate?mode=job", json={"analysis_type": "monthly", "days": 30}, headers=headers)
+    assert response.status_code == 503
+    print(f"Generate with full queue: {response.status_code}")
+    assert client.portal.call(remaining) == before == 5
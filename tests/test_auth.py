@@ -1,5 +1,11 @@
 from fastapi.testclient import TestClient
+from passlib.context import CryptContext
+from sqlalchemy import select, update
 from RacunPlus.main import app
+from RacunPlus.database import SessionLocal
+from RacunPlus.metrics import snapshot
+from RacunPlus.settings import settings
+from RacunPlus.user.models import User
 import uuid
 
 client = TestClient(app)
@@ -40,4 +46,150 @@ def test_3_login_pogresan():
         "password": "pogresna"
     })
     print(f"Wrong password response: {response.status_code}")
-    assert response.status_code == 401
\ No newline at end of file
+    assert response.status_code == 401
+
+
+def test_4_login_rehash():
+    unique_id = uuid.uuid4().hex[:8]
+    username = f"rehash_{unique_id}"
+    client.post("/auth/register", json={
+        "username": username,
+        "email": f"rehash_{unique_id}@example.com",
+        "password": "pass123",
+        "first_name": "Test",
+        "last_name": "User"
+    })
+    cheap_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("pass123")
+
+    async def set_hash():
+        async with SessionLocal() as db:
+            await db.execute(update(User).where(User.username == username).values(hashed_password=cheap_hash))
+            await db.commit()
+
+    async def get_hash():
+        async with SessionLocal() as db:
+            return await db.scalar(select(User.hashed_password).where(User.username == username))
+
+    client.portal.call(set_hash)
+    response = client.post("/auth/login", data={"username": username, "password": "pass123"})
+    print(f"Login with old hash: {response.status_code}")
+    assert response.status_code == 200
+
+    new_hash = client.portal.call(get_hash)
+    assert new_hash != cheap_hash
+    assert new_hash.startswith(f"$2b${settings.BCRYPT_ROUNDS:02d}$")
+
+    metrics = snapshot()
+    assert metrics["password_hash_queue_depth"] == 0
+    assert metrics["password_hash_seconds"]["count"] > 0
+
+
+def test_5_token_cache():
+    response = client.post("/auth/login", data={
+        "username": "testuser1",
+        "password": "pass123"
+    })
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    before = snapshot()
+    first = client.get("/auth/current-user", headers=headers)
+    second = client.get("/auth/current-user", headers=headers)
+    after = snapshot()
+    print(f"Token cache: {after['token_cache_hits_total'] - before['token_cache_hits_total']} hits")
+    assert first.status_code == second.status_code == 200
+    assert after["token_cache_misses_total"] - before["token_cache_misses_total"] == 1
+    assert after["token_cache_hits_total"] - before["token_cache_hits_total"] >= 1
+
+    response = client.get("/auth/current-user", headers={"Authorization": "Bearer nije.validan.token"})
+    assert response.status_code == 401
+
+
+def test_6_refresh_token_rotation():
+    response = client.post("/auth/login", data={
+        "username": "testuser1",
+        "password": "pass123"
+    })
+    first = response.json()["refresh_token"]
+
+    response = client.post("/auth/refresh", json={"refresh_token": first})
+    print(f"Refresh response: {response.status_code}")
+    assert response.status_code == 200
+    second = response.json()["refresh_token"]
+    assert second != first
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    assert client.get("/auth/current-user", headers=headers).status_code == 200
+
+    # Reusing a rotated token is rejected and revokes the token issued in its place.
+    response = client.post("/auth/refresh", json={"refresh_token": first})
+    print(f"Reused refresh token: {response.status_code}")
+    assert response.status_code == 401
+    response = client.post("/auth/refresh", json={"refresh_token": second})
+    assert response.status_code == 401
+
+
+def test_7_logout_revokes_refresh_token():
+    response = client.post("/auth/login", data={
+        "username": "testuser1",
+        "password": "pass123"
+    })
+    refresh_token = response.json()["refresh_token"]
+
+    response = client.post("/auth/logout", json={"refresh_token": refresh_token})
+    print(f"Logout response: {response.status_code}")
+    assert response.status_code == 200
+    response = client.post("/auth/refresh", json={"refresh_token": refresh_token})
+    assert response.status_code == 401
+
+
+def test_8_register_case_insensitive():
+    unique_id = uuid.uuid4().hex[:8]
+    user = {
+        "username": f"CaseUser_{unique_id}",
+        "email": f"Case_{unique_id}@Example.com",
+        "password": "pass123",
+        "first_name": "Test",
+        "last_name": "User"
+    }
+    assert client.post("/auth/register", json=user).status_code == 201
+
+    response = client.post("/auth/register", json={**user, "username": user["username"].lower(), "email": f"other_{unique_id}@example.com"})
+    print(f"Duplicate username response: {response.status_code}")
+    assert response.status_code == 400
+    response = client.post("/auth/register", json={**user, "username": f"other_{unique_id}", "email": user["email"].upper()})
+    print(f"Duplicate email response: {response.status_code}")
+    assert response.status_code == 400
+
+    response = client.post("/auth/login", data={"username": user["username"].upper(), "password": "pass123"})
+    assert response.status_code == 200
+
+
+def test_9_current_user_etag():
+    unique_id = uuid.uuid4().hex[:8]
+    client.post("/auth/register", json={
+        "username": f"profile_{unique_id}",
+        "email": f"profile_{unique_id}@example.com",
+        "password": "pass123",
+        "first_name": "Test",
+        "last_name": "User"
+    })
+    response = client.post("/auth/login", data={"username": f"profile_{unique_id}", "password": "pass123"})
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    response = client.get("/auth/current-user", headers=headers)
+    etag = response.headers["etag"]
+    assert response.status_code == 200
+
+    before = snapshot()["profile_cache_hits_total"]
+    response = client.get("/auth/current-user", headers={**headers, "If-None-Match": etag})
+    print(f"Revalidation response: {response.status_code}")
+    assert response.status_code == 304
+    assert snapshot()["profile_cache_hits_total"] == before + 1
+
+    response = client.patch("/auth/current-user", json={"first_name": "Promijenjen"}, headers=headers)
+    assert response.status_code == 200
+
+    response = client.get("/auth/current-user", headers={**headers, "If-None-Match": etag})
+    print(f"After profile change: {response.status_code}")
+    assert response.status_code == 200
+    assert response.json()["first_name"] == "Promijenjen"
+    assert response.headers["etag"] != etag
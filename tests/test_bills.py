@@ -46,4 +46,138 @@ def test_2_list_bills():
 def test_3_bill_bez_auth():
     response = client.get("/bills/list")
     print(f"Without auth: {response.status_code}")
-    assert response.status_code in [401, 403]
\ No newline at end of file
+    assert response.status_code in [401, 403]
+
+def test_4_list_bills_paginated():
+    token = get_auth_token()
+    headers = {"Authorization": f"Bearer {token}"}
+
+    for amount in (10.0, 20.0, 30.0):
+        client.post("/bills/create", json={
+            "amount": amount,
+            "beneficiary_name": "Vodovod",
+            "reference_date": str(date.today()),
+            "status": "paid"
+        }, headers=headers)
+
+    response = client.get("/bills/list", params={"limit": 2}, headers=headers)
+    print(f"List bills page 1: {response.status_code}")
+    assert response.status_code == 200
+    page = response.json()
+    assert len(page["items"]) == 2
+    assert page["next_cursor"] is not None
+
+    response = client.get("/bills/list", params={"limit": 2, "cursor": page["next_cursor"]}, headers=headers)
+    assert response.status_code == 200
+    first_ids = {b["id"] for b in page["items"]}
+    assert not first_ids & {b["id"] for b in response.json()["items"]}
+
+
+def test_5_list_bills_filters():
+    token = get_auth_token()
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = client.get("/bills/list", params={
+        "beneficiary_name": "Vodovod",
+        "date_from": str(date.today()),
+        "limit": 200,
+    }, headers=headers)
+    print(f"List bills filtered: {response.status_code}")
+    assert response.status_code == 200
+    assert all(b["beneficiary_name"] == "Vodovod" for b in response.json()["items"])
+
+    response = client.get("/bills/list", params={"limit": 1000}, headers=headers)
+    assert response.status_code == 422
+
+    response = client.get("/bills/list", params={"cursor": "nije-kursor"}, headers=headers)
+    assert response.status_code == 400
+
+
+def test_6_create_bills_bulk():
+    token = get_auth_token()
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = client.post("/bills/bulk", json=[
+        {"amount": 40.0, "beneficiary_name": "EPCG", "reference_date": str(date.today())},
+        {"amount": "nije broj", "beneficiary_name": "EPCG", "reference_date": str(date.today())},
+        {"amount": 25.5, "beneficiary_name": "Telemach", "reference_date": str(date.today()), "status": "unpaid"},
+    ], headers=headers)
+    print(f"Bulk create: {response.status_code}")
+    assert response.status_code == 201
+    data = response.json()
+    assert len(data["created"]) == 2
+    assert [e["index"] for e in data["errors"]] == [1]
+
+
+def test_7_create_bills_bulk_all_invalid():
+    token = get_auth_token()
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = client.post("/bills/bulk", json=[{"amount": 10.0}], headers=headers)
+    print(f"Bulk create invalid: {response.status_code}")
+    assert response.status_code == 422
+
+
+def test_8_bills_summary():
+    token = get_auth_token()
+    headers = {"Authorization": f"Bearer {token}"}
+    today = date.today()
+
+    client.post("/bills/create", json={
+        "amount": 60.0,
+        "beneficiary_name": "EPCG",
+        "reference_date": str(today),
+        "status": "paid"
+    }, headers=headers)
+
+    response = client.get("/bills/summary", params={"date_from": str(today), "date_to": str(today)}, headers=headers)
+    print(f"Bills summary: {response.status_code}")
+    assert response.status_code == 200
+    data = response.json()
+    bills = client.get("/bills/list", params={"date_from": str(today), "date_to": str(today)}, headers=headers).json()
+
+    assert data["count"] == len(bills)
+    assert round(data["total"], 2) == round(sum(b["amount"] for b in bills), 2)
+    assert [m["month"] for m in data["by_month"]] == [today.strftime("%Y-%m")]
+    assert "Electricity" in {c["category"] for c in data["by_category"]}
+    assert sum(b["count"] for b in data["by_beneficiary"]) == len(bills)
+
+
+def test_9_update_patch_delete_bill():
+    token = get_auth_token()
+    headers = {"Authorization": f"Bearer {token}"}
+
+    bill_id = client.post("/bills/create", json={
+        "amount": 55.0,
+        "beneficiary_name": "Vodovod",
+        "reference_date": str(date.today()),
+        "status": "unpaid"
+    }, headers=headers).json()["id"]
+
+    response = client.put(f"/bills/{bill_id}", json={
+        "amount": 60.0,
+        "beneficiary_name": "Vodovod",
+        "reference_date": str(date.today()),
+        "status": "unpaid"
+    }, headers=headers)
+    print(f"Update bill: {response.status_code}")
+    assert response.status_code == 200
+    assert response.json()["amount"] == 60.0
+
+    response = client.patch(f"/bills/{bill_id}", json={"status": "paid"}, headers=headers)
+    print(f"Patch bill: {response.status_code}")
+    assert response.status_code == 200
+    assert response.json()["status"] == "paid"
+    assert response.json()["amount"] == 60.0
+
+    response = client.patch(f"/bills/{bill_id}", json={}, headers=headers)
+    assert response.status_code == 400
+
+    response = client.delete(f"/bills/{bill_id}", headers=headers)
+    print(f"Delete bill: {response.status_code}")
+    assert response.status_code == 200
+
+    response = client.patch(f"/bills/{bill_id}", json={"status": "paid"}, headers=headers)
+    assert response.status_code == 404
+    response = client.delete(f"/bills/{bill_id}", headers=headers)
+    assert response.status_code == 404
@@ -0,0 +1,23 @@
+from fastapi.testclient import TestClient
+from RacunPlus.main import app
+from RacunPlus.settings import settings
+
+client = TestClient(app)
+
+
+def test_1_pool_metrics():
+    response = client.get("/metrics")
+    print(f"Metrics: {response.status_code}")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["db_pool_size"] == settings.DB_POOL_SIZE
+    assert data["db_pool_checked_out"] == 0
+    assert "db_pool_overflow" in data
+
+
+def test_2_pool_warmed_up():
+    data = client.get("/metrics").json()
+    if settings.DB_POOL_WARMUP:
+        assert data["db_pool_checked_in"] >= settings.DB_POOL_SIZE
+    assert data["db_pool_wait_seconds"]["count"] >= data["db_pool_checked_in"]
+    assert data["db_pool_wait_seconds"]["buckets"]["+Inf"] == data["db_pool_wait_seconds"]["count"]
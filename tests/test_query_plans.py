@@ -0,0 +1,124 @@
+import importlib.util
+import json
+import uuid
+from datetime import date, timedelta
+from pathlib import Path
+
+from sqlalchemy import create_engine, func, select, text, tuple_
+from sqlalchemy.dialects import postgresql
+
+from RacunPlus.settings import settings
+from RacunPlus.bill.models import Bill
+from RacunPlus.transaction.models import Transaction
+from RacunPlus.app.analysis.models.analysis import Analysis
+from RacunPlus.user.models import User
+
+USER_ID = uuid.uuid4()
+
+engine = create_engine(settings.DATABASE_URL)
+
+
+def explain(stmt):
+    # With seqscan disabled the planner only picks a Seq Scan when no usable index exists,
+    # so the plan does not depend on how much data the test database happens to hold.
+    sql = str(stmt.compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True}))
+    with engine.connect() as conn:
+        conn.execute(text('SET LOCAL enable_seqscan = off'))
+        plan = conn.execute(text(f'EXPLAIN (FORMAT JSON) {sql}')).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']
+
+
+def plan_nodes(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+def assert_uses_index(stmt, index_name):
+    nodes = list(plan_nodes(explain(stmt)))
+    print([(n['Node Type'], n.get('Index Name')) for n in nodes])
+    assert not [n for n in nodes if n['Node Type'] == 'Seq Scan']
+    assert index_name in {n.get('Index Name') for n in nodes}
+
+
+def test_1_fetch_user_bills_plan():
+    end = date.today()
+    stmt = select(Bill).where(
+        Bill.user_id == USER_ID,
+        Bill.reference_date >= end - timedelta(days=30),
+        Bill.reference_date <= end,
+    )
+    assert_uses_index(stmt, 'ix_bills_user_id_reference_date')
+
+
+def test_2_list_bills_page_plan():
+    stmt = select(Bill).where(
+        Bill.user_id == USER_ID,
+        tuple_(Bill.reference_date, Bill.id) < (date.today(), uuid.uuid4()),
+    ).order_by(Bill.reference_date.desc(), Bill.id.desc()).limit(51)
+    assert_uses_index(stmt, 'ix_bills_user_id_reference_date')
+
+
+def test_3_list_transactions_plan():
+    stmt = select(Transaction).where(Transaction.user_id == USER_ID).order_by(Transaction.transaction_date)
+    assert_uses_index(stmt, 'ix_transaction_user_id_transaction_date')
+
+
+def test_4_latest_analysis_plan():
+    stmt = select(Analysis).where(
+        Analysis.user_id == USER_ID,
+        Analysis.analysis_type == 'monthly',
+    ).order_by(Analysis.created_at.desc()).limit(1)
+    assert_uses_index(stmt, 'ix_analysis_user_id_created_at')
+
+
+def test_5_analysis_history_plan():
+    stmt = select(Analysis).where(
+        Analysis.user_id == USER_ID
+    ).order_by(Analysis.created_at.desc()).offset(10).limit(10)
+    assert_uses_index(stmt, 'ix_analysis_user_id_created_at')
+
+
+def test_6_login_lookup_plan():
+    stmt = select(User).where(func.lower(User.username) == func.lower('TestUser1'))
+    assert_uses_index(stmt, 'ix_users_username_lower')
+
+
+def load_rollup_migration():
+    path = Path(__file__).resolve().parent.parent / 'alembic' / 'versions' / 'c1744ee18ae4_create_user_monthly_rollup.py'
+    spec = importlib.util.spec_from_file_location('rollup_migration', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_7_rollup_trigger_delete_plan():
+    # The trigger's DELETE of emptied buckets, explained against a stand-in for the old_rows transition
+    # table and a rollup table of realistic size; everything is rolled back with the connection.
+    migration = load_rollup_migration()
+    for source in migration.SOURCES:
+        with engine.connect() as conn:
+            conn.execute(text("INSERT INTO users (id) SELECT gen_random_uuid() FROM generate_series(1, 200)"))
+            conn.execute(text(
+                f"INSERT INTO user_monthly_rollup (user_id, source, month, category, total_amount, item_count) "
+                f"SELECT u.id, '{source['source']}', date '2024-01-01' + m * interval '1 month', c, 10, 1 "
+                f"FROM users u, generate_series(0, 11) m, unnest(array['Electricity', 'Water', 'Internet', 'Phone', 'Other']) c "
+                f"ON CONFLICT DO NOTHING"
+            ))
+            conn.execute(text(f'CREATE TEMP TABLE old_rows AS SELECT * FROM "{source["table"]}" LIMIT 0'))
+            conn.execute(text(
+                f"INSERT INTO old_rows (user_id, amount, {source['date_column']}, {source['name_column']}) "
+                f"VALUES ('{USER_ID}', 10, current_date, 'EPCG')"
+            ))
+            conn.execute(text('ANALYZE user_monthly_rollup'))
+            conn.execute(text('ANALYZE old_rows'))
+            plan = conn.execute(text(f'EXPLAIN (FORMAT JSON) {migration.DELETE_EMPTY_SQL.format(**source)}')).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        nodes = list(plan_nodes(plan[0]['Plan']))
+        print([(n['Node Type'], n.get('Relation Name'), n.get('Index Name'), n.get('Index Cond')) for n in nodes])
+        rollup_scans = [n for n in nodes if n.get('Relation Name') == 'user_monthly_rollup' and n['Node Type'] != 'ModifyTable']
+        assert rollup_scans and all(n.get('Index Name') == 'user_monthly_rollup_pkey' for n in rollup_scans)
+        assert all('user_id' in n.get('Index Cond', '') for n in rollup_scans)
@@ -0,0 +1,77 @@
+from datetime import date
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from RacunPlus import database
+from RacunPlus.main import app
+from RacunPlus.metrics import snapshot
+from RacunPlus.settings import settings
+
+client = TestClient(app)
+
+
+def get_auth_token():
+    client.post("/auth/register", json={
+        "username": "replicauser",
+        "email": "replicauser@example.com",
+        "password": "pass123",
+        "first_name": "Replica",
+        "last_name": "User"
+    })
+    response = client.post("/auth/login", data={
+        "username": "replicauser",
+        "password": "pass123"
+    })
+    return response.json()["access_token"]
+
+
+def use_replica(monkeypatch):
+    # The "replica" is the primary database reached through a second engine.
+    replica = create_async_engine(database.async_database_url(settings.DATABASE_URL), poolclass=NullPool)
+    monkeypatch.setattr(database, "read_session_factories", [database.make_sessionmaker(replica)])
+
+
+def test_1_reads_go_to_replica(monkeypatch):
+    token = get_auth_token()
+    headers = {"Authorization": f"Bearer {token}"}
+    use_replica(monkeypatch)
+    monkeypatch.setattr(database, "_recent_writes", {})
+
+    before = snapshot()["db_reads_replica_total"]
+    response = client.get("/bills/list", headers=headers)
+    print(f"List bills on replica: {response.status_code}")
+    assert response.status_code == 200
+    assert snapshot()["db_reads_replica_total"] == before + 1
+
+
+def test_2_read_your_writes(monkeypatch):
+    token = get_auth_token()
+    headers = {"Authorization": f"Bearer {token}"}
+    use_replica(monkeypatch)
+
+    response = client.post("/bills/create", json={
+        "amount": 15.0,
+        "beneficiary_name": "Vodovod",
+        "reference_date": str(date.today()),
+        "status": "paid"
+    }, headers=headers)
+    assert response.status_code == 201
+
+    before = snapshot()
+    response = client.get("/bills/list", headers=headers)
+    print(f"List bills after write: {response.status_code}")
+    assert response.status_code == 200
+    after = snapshot()
+    assert after["db_reads_primary_total"] == before["db_reads_primary_total"] + 1
+    assert after["db_reads_replica_total"] == before["db_reads_replica_total"]
+
+
+def test_3_no_replica_configured():
+    token = get_auth_token()
+    headers = {"Authorization": f"Bearer {token}"}
+
+    before = snapshot()["db_reads_primary_total"]
+    response = client.get("/auth/current-user", headers=headers)
+    print(f"Current user without replica: {response.status_code}")
+    assert response.status_code == 200
+    assert snapshot()["db_reads_primary_total"] == before + 1
@@ -0,0 +1,94 @@
+from fastapi.testclient import TestClient
+from RacunPlus.main import app
+from RacunPlus.database import SessionLocal
+from RacunPlus.rollup.service import check_rollup
+
+client = TestClient(app)
+
+MONTH = {"month_from": "2001-03-01", "month_to": "2001-03-31"}
+
+
+def get_auth_token():
+    client.post("/auth/register", json={
+        "username": "rollupuser",
+        "email": "rollupuser@example.com",
+        "password": "pass123",
+        "first_name": "Rollup",
+        "last_name": "User"
+    })
+    response = client.post("/auth/login", data={
+        "username": "rollupuser",
+        "password": "pass123"
+    })
+    return response.json()["access_token"]
+
+
+def clear_month(headers):
+    bills = client.get("/bills/list", params={"date_from": "2001-03-01", "date_to": "2001-03-31"}, headers=headers).json()
+    for bill in bills:
+        client.delete(f"/bills/{bill['id']}", headers=headers)
+
+
+def internet_rollup(headers):
+    response = client.get("/rollup/monthly", params={"source": "bill", **MONTH}, headers=headers)
+    assert response.status_code == 200
+    rows = [r for r in response.json() if r["category"] == "Internet"]
+    return rows[0] if rows else None
+
+
+def test_1_rollup_follows_bill_writes():
+    token = get_auth_token()
+    headers = {"Authorization": f"Bearer {token}"}
+    clear_month(headers)
+    assert internet_rollup(headers) is None
+
+    ids = []
+    for amount, day in ((10.0, "2001-03-02"), (25.0, "2001-03-15"), (40.0, "2001-03-28")):
+        response = client.post("/bills/create", json={
+            "amount": amount,
+            "beneficiary_name": "Telemach",
+            "reference_date": day,
+            "status": "paid"
+        }, headers=headers)
+        ids.append(response.json()["id"])
+
+    row = internet_rollup(headers)
+    print(f"Rollup after insert: {row}")
+    assert row == {"source": "bill", "month": "2001-03", "category": "Internet",
+                   "total_amount": 75.0, "count": 3, "min_amount": 10.0, "max_amount": 40.0}
+
+    response = client.put(f"/bills/{ids[2]}", json={
+        "amount": 5.0,
+        "beneficiary_name": "Telemach",
+        "reference_date": "2001-03-28",
+        "status": "paid"
+    }, headers=headers)
+    assert response.status_code == 200
+    row = internet_rollup(headers)
+    print(f"Rollup after update: {row}")
+    assert (row["total_amount"], row["count"], row["min_amount"], row["max_amount"]) == (40.0, 3, 5.0, 25.0)
+
+    response = client.delete(f"/bills/{ids[1]}", headers=headers)
+    assert response.status_code == 200
+    row = internet_rollup(headers)
+    print(f"Rollup after delete: {row}")
+    assert (row["total_amount"], row["count"], row["min_amount"], row["max_amount"]) == (15.0, 2, 5.0, 10.0)
+
+    clear_month(headers)
+    assert internet_rollup(headers) is None
+
+
+def test_2_rollup_matches_base_tables():
+    async def check():
+        async with SessionLocal() as db:
+            return await check_rollup(db)
+
+    mismatches = client.portal.call(check)
+    print(f"Rollup mismatches: {len(mismatches)}")
+    assert mismatches == []
+
+
+def test_3_rollup_bez_auth():
+    response = client.get("/rollup/monthly")
+    print(f"Without auth: {response.status_code}")
+    assert response.status_code in [401, 403]
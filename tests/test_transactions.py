@@ -1,3 +1,7 @@
+import csv
+import io
+import json
+import uuid
 from datetime import date
 from fastapi.testclient import TestClient
 from RacunPlus.main import app
@@ -47,3 +51,124 @@ def test_3_transaction_bez_auth():
     response = client.get("/transactions/list")
     print(f"Without auth: {response.status_code}")
     assert response.status_code in [401, 403]
+
+
+def test_4_export_transactions_ndjson():
+    token = get_auth_token()
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = client.get("/transactions/export", params={"format": "ndjson"}, headers=headers)
+    print(f"Export ndjson: {response.status_code}")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines
+    assert all(line["merchant_name"] for line in lines)
+
+
+def test_5_export_transactions_csv():
+    token = get_auth_token()
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = client.get("/transactions/export", params={"format": "csv"}, headers=headers)
+    print(f"Export csv: {response.status_code}")
+    assert response.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert rows
+    assert set(rows[0]) == {"id", "user_id", "amount", "merchant_name", "transaction_date", "status"}
+
+
+def test_6_import_transactions_csv():
+    token = get_auth_token()
+    headers = {"Authorization": f"Bearer {token}"}
+    merchant = f"Import {uuid.uuid4().hex[:8]}"
+    statement = (
+        "Datum,Opis,Iznos\n"
+        f"01.03.2026,{merchant},\"12,50\"\n"
+        f"02.03.2026,{merchant},7.00\n"
+        f"02.03.2026,{merchant},7.00\n"
+        "nije datum,Market,1.00\n"
+        "03.03.2026,Market,inf\n"
+        "03.03.2026,Market,NaN\n"
+    )
+
+    response = client.post("/transactions/import", files={
+        "file": ("izvod.csv", statement, "text/csv")
+    }, headers=headers)
+    print(f"Import csv: {response.status_code}")
+    assert response.status_code == 201
+    report = response.json()
+    assert report["parsed"] == 3
+    # Two identical purchases on the same day are both kept.
+    assert report["inserted"] == 3
+    assert report["invalid"] == 3
+
+    response = client.post("/transactions/import", files={
+        "file": ("izvod.csv", statement, "text/csv")
+    }, headers=headers)
+    assert response.json()["inserted"] == 0
+
+    # A later statement with a third identical line adds only that one.
+    response = client.post("/transactions/import", files={
+        "file": ("izvod.csv", statement + f"02.03.2026,{merchant},7.00\n", "text/csv")
+    }, headers=headers)
+    assert response.json()["inserted"] == 1
+
+
+def test_7_import_transactions_missing_columns():
+    token = get_auth_token()
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = client.post("/transactions/import", files={
+        "file": ("izvod.csv", "foo,bar\n1,2\n", "text/csv")
+    }, headers=headers)
+    print(f"Import bad csv: {response.status_code}")
+    assert response.status_code == 400
+
+    # Lines the csv module or Postgres cannot take are reported, not a server error.
+    merchant = f"Import {uuid.uuid4().hex[:8]}"
+    statement = (
+        "Datum,Opis,Iznos\n"
+        "01.03.2026,Mar\x00ket,1.00\n"
+        f"01.03.2026,{'x' * 200000},1.00\n"
+        f"03.03.2026,{merchant},4.00\n"
+    )
+    response = client.post("/transactions/import", files={
+        "file": ("izvod.csv", statement, "text/csv")
+    }, headers=headers)
+    assert response.status_code == 201
+    assert response.json()["inserted"] == 1
+    assert response.json()["invalid"] == 2
+
+    response = client.post("/transactions/import", files={
+        "file": ("izvod.csv", f"Datum,Opis,{'x' * 200000}\n", "text/csv")
+    }, headers=headers)
+    assert response.status_code == 400
+
+
+def test_8_patch_delete_transaction():
+    token = get_auth_token()
+    headers = {"Authorization": f"Bearer {token}"}
+
+    transaction_id = client.post("/transactions/create", json={
+        "amount": 12.5,
+        "merchant_name": "Market",
+        "transaction_date": str(date.today())
+    }, headers=headers).json()["id"]
+
+    response = client.patch(f"/transactions/{transaction_id}", json={"amount": 13.0}, headers=headers)
+    print(f"Patch transaction: {response.status_code}")
+    assert response.status_code == 200
+    assert response.json()["amount"] == 13.0
+    assert response.json()["merchant_name"] == "Market"
+
+    response = client.delete(f"/transactions/{transaction_id}", headers=headers)
+    print(f"Delete transaction: {response.status_code}")
+    assert response.status_code == 200
+
+    response = client.put(f"/transactions/{transaction_id}", json={
+        "amount": 1.0,
+        "merchant_name": "Market",
+        "transaction_date": str(date.today())
+    }, headers=headers)
+    assert response.status_code == 404